@@ -1,12 +1,89 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fhir.resources.patient import Patient
-from pymongo import MongoClient
-from pymongo.server_api import ServerApi
+from fastapi.middleware.gzip import GZipMiddleware
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 import os
+from app.arranque import precargar_modelos, precargado, tiempo_arranque, tiempos_importacion
 
-app = FastAPI()
+# Carga los modelos FHIR antes que el resto de la aplicación. Con preload_app
+# esto ocurre una sola vez en el master de gunicorn.
+precargar_modelos()
+
+from app.controlador import admision, solicitudes
+from app.controlador.bundle import operation_outcome, procesar_bundle
+from app.controlador.busqueda import buscar_pacientes, construir_bundle, SearchParameterError
+from app.controlador.cache import patient_cache
+from app.controlador.condicional import ConditionalCreateError, crear_si_no_existe, exigir_identificador, leer_if_none_exist
+from app.controlador.db import COLLECTION_NAME, DB_NAME, SERVICE_REQUEST_COLLECTION, crear_cliente, pool_stats
+from app.controlador.escritura import WRITE_MODE, WriteBatcher
+from app.controlador.export import generar_ndjson
+from app.controlador.indice_identificadores import IDENTIFIER_INDEX, indice_identificadores, registrar_escritura
+from app.controlador.indices import inicializar_indices
+from app.controlador.lecturas import CONSISTENCY_HEADER, aplicar_token, coleccion_causal, coleccion_lecturas, token_consistencia
+from app.controlador.lookup import LOOKUP_STREAM_THRESHOLD, IdentifierLookupError, leer_pares, resolver_dict, resolver_stream
+from app.controlador.metricas import WORKER_COLD_START, generar_metricas, instalar_middleware
+from app.controlador.perfilado import instalar_perfilado
+from app.controlador.mpi import bundle_coincidencias, buscar_coincidencias, leer_parametros_match
+from app.controlador.singleflight import patient_flight
+from app.controlador.serializacion import FHIRJSONResponse
+from app.controlador.tokens import PROYECCION_PUBLICA
+from app.controlador.validacion import cerrar_pool, validar_paciente
+from app.controlador.versiones import coincide, etag
+
+# Conexión a MongoDB Atlas. El cliente se crea en el lifespan, es decir dentro
+# de cada worker ya forkeado, y se cierra al apagar el worker.
+client = None
+db = None
+collection = None
+# Vistas de lectura enrutadas según READ_PREFERENCE (las escrituras usan `collection`)
+lecturas = None
+lecturas_causales = None
+# ServiceRequest en su propia colección
+service_requests = None
+lecturas_service_requests = None
+# Escritor por micro-lotes (WRITE_MODE=batch|async)
+escritor = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client, db, collection, lecturas, lecturas_causales, escritor
+    global service_requests, lecturas_service_requests
+    client = crear_cliente()
+    db = client[DB_NAME]
+    collection = db[COLLECTION_NAME]
+    lecturas = coleccion_lecturas(collection)
+    lecturas_causales = coleccion_causal(collection)
+    service_requests = db[SERVICE_REQUEST_COLLECTION]
+    lecturas_service_requests = coleccion_lecturas(service_requests)
+    escritor = WriteBatcher(collection)
+    try:
+        # Crea los índices registrados y verifica que las consultas los usen
+        await inicializar_indices(collection)
+        await inicializar_indices(service_requests)
+        if IDENTIFIER_INDEX:
+            # Se carga en segundo plano; hasta que esté listo se consulta MongoDB
+            indice_identificadores.iniciar(collection)
+        app.state.cold_start = tiempo_arranque()
+        WORKER_COLD_START.set(app.state.cold_start)
+        yield
+    finally:
+        await indice_identificadores.detener()
+        await escritor.cerrar()
+        cerrar_pool()
+        client.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Control de admisión: es el middleware más interno, así los 503 por
+# saturación también llevan las cabeceras CORS y quedan en /metrics
+admision.instalar_admision(app)
+# Perfilado opcional (PROFILE_TOKEN / PROFILE_SAMPLE_RATE); sin configurar no se instala
+instalar_perfilado(app)
 
 # Configuración CORS: permite solicitudes solo desde tu frontend
 origins = [
@@ -19,51 +96,279 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],          # Permite todos los métodos (GET, POST, etc.)
     allow_headers=["*"],          # Permite todos los headers
+    expose_headers=["ETag", "Location", "Retry-After", "Server-Timing", "X-Profile-Id", CONSISTENCY_HEADER],
 )
 
-# Conexión a MongoDB Atlas
-MONGO_URI = os.getenv("MONGO_URI")
-client = MongoClient(MONGO_URI, server_api=ServerApi('1'))
-db = client["RIS-FINAL"]
-collection = db["solicitud"]
+# Compresión de respuestas por encima de un umbral. Con brotli-asgi instalado
+# se usa br (y gzip para los clientes que no lo aceptan).
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MIN_SIZE, gzip_fallback=True)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
 
-def convert_id(patient):
-    patient["_id"] = str(patient["_id"])
-    return patient
+# Latencia por ruta y solicitudes en curso para /metrics
+instalar_middleware(app)
+
+def resource_response(patient, if_none_match):
+    # Si el cliente ya tiene esta versión se responde 304 sin serializar el cuerpo
+    tag = etag(patient)
+    if coincide(if_none_match, tag):
+        return Response(status_code=304, headers={"ETag": tag})
+    return FHIRJSONResponse(patient, headers={"ETag": tag})
 
 @app.post("/patient")
-def create_patient(patient_data: dict):
+async def create_patient(patient_data: dict, if_none_exist: str | None = Header(None)):
     try:
-        pat = Patient.model_validate(patient_data)
-        data = pat.model_dump(by_alias=True, exclude_unset=True)
-        result = collection.insert_one(data)
-        return {"inserted_id": str(result.inserted_id)}
+        data = await validar_paciente(patient_data)
+        if if_none_exist is not None:
+            return await conditional_create(data, if_none_exist)
+        if WRITE_MODE == "async":
+            respuesta = JSONResponse(status_code=202, content={"inserted_id": str(escritor.aceptar(data))})
+        elif WRITE_MODE == "batch":
+            respuesta = {"inserted_id": str(await escritor.insertar(data))}
+        else:
+            # Sesión causal: el token devuelto permite al cliente leer su propia
+            # escritura aunque las lecturas vayan a un secundario.
+            async with await client.start_session(causal_consistency=True) as session:
+                result = await collection.insert_one(data, session=session)
+                token = token_consistencia(session)
+            headers = {CONSISTENCY_HEADER: token} if token else None
+            respuesta = JSONResponse(content={"inserted_id": str(result.inserted_id)}, headers=headers)
+        registrar_escritura(data)
+        return respuesta
+    except HTTPException:
+        raise
+    except DuplicateKeyError:
+        # Solo con PATIENT_IDENTIFIER_UNIQUE: otro paciente ya tiene ese identificador
+        raise HTTPException(
+            status_code=409,
+            detail=operation_outcome("Ya existe un paciente con uno de estos identificadores", code="duplicate"),
+        )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+async def conditional_create(data, if_none_exist):
+    # Creación condicional FHIR: 201 si se creó, 200 con el id si ya existía
+    try:
+        system, value = leer_if_none_exist(if_none_exist)
+        exigir_identificador(data, system, value)
+    except ConditionalCreateError as e:
+        raise HTTPException(status_code=400, detail=operation_outcome(str(e)))
+    async with await client.start_session(causal_consistency=True) as session:
+        patient_id, creado = await crear_si_no_existe(collection, data, system, value, session=session)
+        token = token_consistencia(session)
+    headers = {"Location": f"Patient/{patient_id}"}
+    if token:
+        headers[CONSISTENCY_HEADER] = token
+    if creado:
+        registrar_escritura(dict(data, _id=patient_id))
+        return JSONResponse(status_code=201, content={"inserted_id": str(patient_id)}, headers=headers)
+    return JSONResponse(status_code=200, content={"existing_id": str(patient_id)}, headers=headers)
+
+async def find_patient(filtro, clave, desde_cache, token):
+    """
+    Lectura de un paciente. Con token de consistencia se lee en una sesión
+    causal (sin caché ni coalescencia); si no, caché -> single-flight -> Mongo.
+    """
+    if token:
+        async with await client.start_session(causal_consistency=True) as session:
+            aplicar_token(session, token)
+            return await lecturas_causales.find_one(filtro, PROYECCION_PUBLICA, session=session)
+    patient = desde_cache()
+    if patient is None:
+        patient = await patient_flight.do(clave, lambda: lecturas.find_one(filtro, PROYECCION_PUBLICA))
+        if patient:
+            patient_cache.put(patient)
+    return patient
+
 @app.get("/patient/id/{patient_id}")
-def get_patient_by_id(patient_id: str):
+async def get_patient_by_id(
+    patient_id: str,
+    if_none_match: str | None = Header(None),
+    x_consistency_token: str | None = Header(None),
+):
     try:
-        patient = collection.find_one({"_id": ObjectId(patient_id)})
+        patient = await find_patient(
+            {"_id": ObjectId(patient_id)},
+            ("id", patient_id),
+            lambda: patient_cache.get_by_id(patient_id),
+            x_consistency_token,
+        )
         if not patient:
             raise HTTPException(status_code=404, detail="Patient not found")
-        return convert_id(patient)
+        return resource_response(patient, if_none_match)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/patient/identifier")
-def get_patient_by_identifier(system: str, value: str):
+async def get_patient_by_identifier(
+    system: str,
+    value: str,
+    if_none_match: str | None = Header(None),
+    x_consistency_token: str | None = Header(None),
+):
     try:
-        patient = collection.find_one({
-            "identifier": {
-                "$elemMatch": {
-                    "system": system,
-                    "value": value
+        if indice_identificadores.listo and not x_consistency_token:
+            # Índice en memoria: not-found sin ir a MongoDB, acierto como lectura por _id
+            patient_id = indice_identificadores.buscar(system, value)
+            if patient_id is None:
+                raise HTTPException(status_code=404, detail="Patient not found")
+            patient = await find_patient(
+                {"_id": patient_id},
+                ("id", str(patient_id)),
+                lambda: patient_cache.get_by_id(str(patient_id)),
+                None,
+            )
+            if not patient:
+                raise HTTPException(status_code=404, detail="Patient not found")
+            return resource_response(patient, if_none_match)
+        patient = await find_patient(
+            {
+                "identifier": {
+                    "$elemMatch": {
+                        "system": system,
+                        "value": value
+                    }
                 }
-            }
-        })
+            },
+            ("identifier", system, value),
+            lambda: patient_cache.get_by_identifier(system, value),
+            x_consistency_token,
+        )
         if not patient:
             raise HTTPException(status_code=404, detail="Patient not found")
-        return convert_id(patient)
+        return resource_response(patient, if_none_match)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/patient/identifier/$lookup")
+async def lookup_patients_by_identifier(body: dict):
+    try:
+        pares = leer_pares(body)
+    except IdentifierLookupError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Listas grandes se envían en streaming a medida que llegan del cursor
+    if len(pares) > LOOKUP_STREAM_THRESHOLD:
+        return StreamingResponse(resolver_stream(lecturas, patient_cache, pares), media_type="application/json")
+    return FHIRJSONResponse(await resolver_dict(lecturas, patient_cache, pares))
+
+@app.get("/Patient")
+async def search_patients(request: Request):
+    try:
+        documentos, hay_mas = await buscar_pacientes(lecturas, request.query_params)
+    except SearchParameterError as e:
+        raise HTTPException(status_code=400, detail=operation_outcome(str(e)))
+    return FHIRJSONResponse(construir_bundle(documentos, hay_mas, request.url))
+
+@app.get("/Patient/{patient_id}/$everything")
+async def patient_everything(patient_id: str):
+    # Paciente y sus ServiceRequest en una sola agregación, sin N+1 desde el frontend
+    try:
+        oid = ObjectId(patient_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail=operation_outcome(f"id inválido: {patient_id!r}"))
+    paciente = await solicitudes.paciente_con_solicitudes(lecturas, oid)
+    if paciente is None:
+        raise HTTPException(status_code=404, detail=operation_outcome("Patient not found", code="not-found"))
+    return FHIRJSONResponse(solicitudes.bundle_everything(paciente))
+
+@app.post("/ServiceRequest")
+async def create_service_request(data: dict):
+    try:
+        inserted_id = await solicitudes.crear_solicitud(collection, service_requests, data)
+    except solicitudes.ServiceRequestValidationError as e:
+        raise HTTPException(status_code=400, detail=operation_outcome(str(e)))
+    return JSONResponse(
+        status_code=201,
+        content={"inserted_id": str(inserted_id)},
+        headers={"Location": f"ServiceRequest/{inserted_id}"},
+    )
+
+@app.get("/ServiceRequest/{request_id}")
+async def get_service_request(request_id: str, if_none_match: str | None = Header(None)):
+    try:
+        oid = ObjectId(request_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail=operation_outcome(f"id inválido: {request_id!r}"))
+    documento = await lecturas_service_requests.find_one({"_id": oid}, solicitudes.PROYECCION_SOLICITUD)
+    if not documento:
+        raise HTTPException(status_code=404, detail=operation_outcome("ServiceRequest not found", code="not-found"))
+    return resource_response(documento, if_none_match)
+
+@app.get("/ServiceRequest")
+async def search_service_requests(request: Request):
+    try:
+        documentos, hay_mas = await solicitudes.buscar_solicitudes(lecturas_service_requests, request.query_params)
+    except SearchParameterError as e:
+        raise HTTPException(status_code=400, detail=operation_outcome(str(e)))
+    return FHIRJSONResponse(solicitudes.construir_bundle(documentos, hay_mas, request.url))
+
+@app.post("/Patient/$match")
+async def match_patient(parametros: dict):
+    try:
+        recurso, count, only_certain = leer_parametros_match(parametros)
+        recurso = await validar_paciente(recurso)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=operation_outcome(str(e)))
+    resultados = await buscar_coincidencias(lecturas, recurso, count, only_certain)
+    return FHIRJSONResponse(bundle_coincidencias(resultados))
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return patient_cache.stats()
+
+@app.get("/write/stats")
+async def write_stats():
+    return escritor.stats()
+
+@app.get("/admission/stats")
+async def admission_stats():
+    return admision.stats()
+
+@app.get("/identifier-index/stats")
+async def identifier_index_stats():
+    return indice_identificadores.stats()
+
+@app.get("/singleflight/stats")
+async def singleflight_stats():
+    return patient_flight.stats()
+
+@app.get("/metrics")
+async def metrics():
+    contenido, content_type = generar_metricas()
+    return Response(content=contenido, media_type=content_type)
+
+@app.get("/health/db")
+async def health_db():
+    try:
+        await client.admin.command("ping")
+    except Exception as e:
+        return JSONResponse(status_code=503, content={"status": f"error: {e}", "pool": pool_stats.stats()})
+    return {"status": "ok", "pool": pool_stats.stats()}
+
+@app.get("/health/startup")
+async def health_startup():
+    return {
+        "preloaded": precargado(),
+        "cold_start_seconds": app.state.cold_start,
+        "imports_seconds": tiempos_importacion,
+    }
+
+@app.post("/")
+async def process_bundle(bundle: dict):
+    try:
+        return await procesar_bundle(client, collection, bundle)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=operation_outcome(str(e)))
+
+@app.get("/Patient/$export")
+async def export_patients(_type: str = "Patient", batch_size: int | None = None):
+    if _type != "Patient":
+        raise HTTPException(status_code=400, detail=f"Tipo no soportado: {_type}")
+    # La compresión la aplica el middleware, también sobre el streaming
+    return StreamingResponse(
+        generar_ndjson(lecturas, {"resourceType": "Patient"}, batch_size=batch_size),
+        media_type="application/fhir+ndjson",
+    )
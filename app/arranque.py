@@ -0,0 +1,89 @@
+"""
+Medición del arranque de los workers.
+
+- precargar_modelos(): importa los modelos FHIR y registra cuánto tarda.
+  Con preload_app (gunicorn.conf.py) esto ocurre una sola vez en el master y
+  los workers heredan los módulos ya cargados por copy-on-write.
+- tiempo_arranque(): segundos desde el fork del worker (post_fork) hasta que
+  la aplicación terminó su lifespan de inicio.
+- perfil_importacion(): desglose equivalente a `python -X importtime`.
+
+Uso desde la línea de comandos:
+    python -m app.arranque --top 30
+"""
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Momento en que el proceso cargó este módulo (en el master si hay preload)
+INICIO_IMPORTACION = time.time()
+
+# Módulos pesados que conviene cargar antes del fork
+MODULOS_PRECARGA = ("fhir.resources.patient", "fhir.resources.servicerequest")
+
+tiempos_importacion = {}
+
+
+def precargar_modelos(modulos=MODULOS_PRECARGA):
+    """Importa los modelos indicados y guarda el tiempo de cada uno (segundos)."""
+    for nombre in modulos:
+        inicio = time.perf_counter()
+        importlib.import_module(nombre)
+        tiempos_importacion.setdefault(nombre, round(time.perf_counter() - inicio, 4))
+    return tiempos_importacion
+
+
+def precargado():
+    """True si el worker viene de un master que ya cargó la aplicación."""
+    return os.getenv("GUNICORN_PRELOADED") == "1"
+
+
+def tiempo_arranque():
+    """
+    Segundos desde el fork del worker hasta ahora. Sin gunicorn (uvicorn
+    directo) se mide desde la importación de este módulo.
+    """
+    desde = float(os.getenv("WORKER_FORKED_AT", INICIO_IMPORTACION))
+    return round(time.time() - desde, 4)
+
+
+def perfil_importacion(modulo="app.app", top=25):
+    """
+    Ejecuta `python -X importtime -c "import <modulo>"` en un proceso limpio
+    y devuelve los `top` módulos con mayor tiempo acumulado (microsegundos).
+    """
+    proceso = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    filas = []
+    for linea in proceso.stderr.splitlines():
+        if not linea.startswith("import time:") or "self [us]" in linea:
+            continue
+        propio, acumulado, nombre = linea[len("import time:"):].split("|", 2)
+        filas.append({
+            "module": nombre.strip(),
+            "depth": (len(nombre) - len(nombre.lstrip()) - 1) // 2,
+            "self_us": int(propio),
+            "cumulative_us": int(acumulado),
+        })
+    filas.sort(key=lambda f: f["cumulative_us"], reverse=True)
+    return filas[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modulo", default="app.app")
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+    print(json.dumps(perfil_importacion(args.modulo, args.top), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Control de admisión por worker.
+
+Cada worker atiende como mucho N lecturas y M escrituras a la vez; el resto
+espera en una cola acotada. Si la cola está llena, o si una solicitud
+espera más que ADMISSION_QUEUE_TIMEOUT_MS, se responde 503 con Retry-After
+de inmediato. Así, cuando MongoDB se pone lento, las solicitudes no se
+acumulan sin límite frente al pool de conexiones hasta chocar con el
+timeout de 120 s de gunicorn (que mata al worker); la latencia de las que
+sí se atienden queda acotada por la espera máxima más el tiempo de servicio.
+
+Las lecturas y las escrituras tienen presupuestos separados para que una
+ráfaga de imports no deje sin servicio a las consultas, ni al revés. Las
+rutas de operación (/health, /metrics, */stats) no pasan por la admisión.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+
+from fastapi.responses import JSONResponse
+
+from app.controlador.bundle import operation_outcome
+from app.controlador.metricas import ADMISSION_QUEUE_DEPTH, ADMISSION_QUEUE_WAIT, ADMISSION_SHED
+
+# Solicitudes atendidas a la vez por worker (0 = sin límite para esa clase).
+# Conviene que lecturas + escrituras no superen MONGO_MAX_POOL_SIZE.
+ADMISSION_READ_CONCURRENCY = int(os.getenv("ADMISSION_READ_CONCURRENCY", "32"))
+ADMISSION_WRITE_CONCURRENCY = int(os.getenv("ADMISSION_WRITE_CONCURRENCY", "16"))
+# Solicitudes que pueden esperar turno; más allá se rechazan
+ADMISSION_READ_QUEUE = int(os.getenv("ADMISSION_READ_QUEUE", "64"))
+ADMISSION_WRITE_QUEUE = int(os.getenv("ADMISSION_WRITE_QUEUE", "32"))
+# Espera máxima en la cola antes de responder 503
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "2000"))
+# Valor de la cabecera Retry-After (segundos)
+ADMISSION_RETRY_AFTER = os.getenv("ADMISSION_RETRY_AFTER", "1")
+
+# Operaciones POST que solo leen
+_POST_DE_LECTURA = ("$lookup", "$match")
+
+
+class AdmissionRejected(Exception):
+    """La solicitud no obtuvo turno: cola llena o espera agotada."""
+
+    def __init__(self, motivo):
+        super().__init__(motivo)
+        self.motivo = motivo
+
+
+class Compuerta:
+    """
+    Semáforo con cola FIFO acotada y espera máxima.
+
+    Al salir, el turno pasa directamente al primero de la cola, de modo que
+    una solicitud nueva no puede adelantarse a las que ya esperan.
+    """
+
+    def __init__(self, nombre, limite, cola, espera_ms):
+        self.nombre = nombre
+        self.limite = limite
+        self.cola = cola
+        self.espera = espera_ms / 1000
+        self.en_curso = 0
+        self._esperando = deque()
+        self.admitidas = 0
+        self.rechazadas = {"queue_full": 0, "timeout": 0}
+
+    def _rechazar(self, motivo):
+        self.rechazadas[motivo] += 1
+        ADMISSION_SHED.labels(self.nombre, motivo).inc()
+        raise AdmissionRejected(motivo)
+
+    async def entrar(self):
+        if self.limite <= 0:
+            return
+        if self.en_curso < self.limite and not self._esperando:
+            self.en_curso += 1
+            self.admitidas += 1
+            ADMISSION_QUEUE_WAIT.labels(self.nombre).observe(0)
+            return
+        if len(self._esperando) >= self.cola:
+            self._rechazar("queue_full")
+
+        turno = asyncio.get_running_loop().create_future()
+        self._esperando.append(turno)
+        profundidad = ADMISSION_QUEUE_DEPTH.labels(self.nombre)
+        profundidad.inc()
+        inicio = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(turno), self.espera)
+        except asyncio.TimeoutError:
+            if not turno.done():
+                turno.cancel()
+                self._esperando.remove(turno)
+                self._rechazar("timeout")
+        except asyncio.CancelledError:
+            # El cliente se fue mientras esperaba
+            if turno.done() and not turno.cancelled():
+                self.salir()
+            else:
+                turno.cancel()
+                self._esperando.remove(turno)
+            raise
+        finally:
+            profundidad.dec()
+            ADMISSION_QUEUE_WAIT.labels(self.nombre).observe(time.perf_counter() - inicio)
+        self.admitidas += 1
+
+    def salir(self):
+        if self.limite <= 0:
+            return
+        while self._esperando:
+            turno = self._esperando.popleft()
+            if not turno.done():
+                # El turno se transfiere: en_curso no cambia
+                turno.set_result(None)
+                return
+        self.en_curso -= 1
+
+    def stats(self):
+        return {
+            "limit": self.limite,
+            "queue_limit": self.cola,
+            "in_flight": self.en_curso,
+            "queued": len(self._esperando),
+            "admitted": self.admitidas,
+            "shed": dict(self.rechazadas),
+        }
+
+
+lecturas = Compuerta("read", ADMISSION_READ_CONCURRENCY, ADMISSION_READ_QUEUE, ADMISSION_QUEUE_TIMEOUT_MS)
+escrituras = Compuerta("write", ADMISSION_WRITE_CONCURRENCY, ADMISSION_WRITE_QUEUE, ADMISSION_QUEUE_TIMEOUT_MS)
+
+
+def clasificar(method, path):
+    """Compuerta que corresponde a la solicitud, o None si no pasa por la admisión."""
+    if path == "/metrics" or path.startswith("/health") or path.endswith("/stats"):
+        return None
+    if method in ("GET", "HEAD") or path.endswith(_POST_DE_LECTURA):
+        return lecturas
+    if method == "OPTIONS":
+        return None
+    return escrituras
+
+
+def respuesta_rechazo(motivo):
+    return JSONResponse(
+        status_code=503,
+        content=operation_outcome(f"Servicio saturado ({motivo}); reintente más tarde", code="throttled"),
+        headers={"Retry-After": ADMISSION_RETRY_AFTER},
+    )
+
+
+def instalar_admision(app):
+    @app.middleware("http")
+    async def admitir(request, call_next):
+        compuerta = clasificar(request.method, request.url.path)
+        if compuerta is None:
+            return await call_next(request)
+        try:
+            await compuerta.entrar()
+        except AdmissionRejected as e:
+            return respuesta_rechazo(e.motivo)
+        try:
+            response = await call_next(request)
+        except BaseException:
+            compuerta.salir()
+            raise
+        # El turno se libera cuando termina el cuerpo (p. ej. $export en streaming)
+        cuerpo = response.body_iterator
+
+        async def liberar_al_terminar():
+            try:
+                async for bloque in cuerpo:
+                    yield bloque
+            finally:
+                compuerta.salir()
+
+        response.body_iterator = liberar_al_terminar()
+        return response
+
+
+def stats():
+    return {"read": lecturas.stats(), "write": escrituras.stats()}
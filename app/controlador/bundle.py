@@ -0,0 +1,159 @@
+import os
+
+from bson import ObjectId
+from bson.errors import InvalidDocument
+from pymongo.errors import BulkWriteError, DocumentTooLarge, PyMongoError
+
+from app.controlador.indice_identificadores import registrar_escritura
+from app.controlador.validacion import validar_lote
+
+# Tamaño de cada lote de insert_many. Lotes grandes amortizan el round trip;
+# demasiado grandes chocan con el límite de 48 MB por mensaje del driver.
+BUNDLE_CHUNK_SIZE = int(os.getenv("BUNDLE_CHUNK_SIZE", "1000"))
+
+
+class BundleError(ValueError):
+    """El Bundle no es procesable como un todo (tipo no soportado, transacción inválida...)."""
+
+
+def operation_outcome(diagnostics, code="invalid"):
+    return {
+        "resourceType": "OperationOutcome",
+        "issue": [{"severity": "error", "code": code, "diagnostics": diagnostics}],
+    }
+
+
+def _respuesta_creada(inserted_id):
+    return {"response": {"status": "201 Created", "location": f"Patient/{inserted_id}"}}
+
+
+def _respuesta_error(status, diagnostics):
+    return {"response": {"status": status, "outcome": operation_outcome(diagnostics)}}
+
+
+def _comprobar_request(entry):
+    """Solo se aceptan entradas POST de Patient."""
+    request = entry.get("request") or {}
+    method = request.get("method", "POST").upper()
+    url = request.get("url", "Patient").split("?")[0].strip("/")
+    if method != "POST" or url != "Patient":
+        raise ValueError(f"Operación no soportada: {method} {url}")
+    return entry.get("resource")
+
+
+async def validar_entradas(entries):
+    """
+    Valida todas las entradas del Bundle. Devuelve, en orden, el documento
+    listo para insertar (con _id preasignado) o la excepción de cada entrada.
+    """
+    resultados = [None] * len(entries)
+    recursos, posiciones = [], []
+    for i, entry in enumerate(entries):
+        try:
+            recursos.append(_comprobar_request(entry))
+            posiciones.append(i)
+        except Exception as e:
+            resultados[i] = e
+
+    for i, data in zip(posiciones, await validar_lote(recursos)):
+        if not isinstance(data, Exception):
+            # El _id se asigna aquí para poder mapear cada entrada a su resultado
+            # aunque insert_many sin orden devuelva errores parciales.
+            data["_id"] = ObjectId()
+        resultados[i] = data
+    return resultados
+
+
+def _lotes(items, tamano):
+    for i in range(0, len(items), tamano):
+        yield items[i:i + tamano]
+
+
+async def _insertar_sin_orden(collection, documentos, session=None):
+    """
+    Inserta los documentos en lotes con insert_many(ordered=False).
+    Devuelve {posición en `documentos`: (status, mensaje)} para los que fallaron.
+
+    Un error que no es por documento (red, timeout, mensaje demasiado
+    grande) marca solo las entradas de ese lote; los lotes anteriores ya
+    están escritos y conservan su 201.
+    """
+    fallidos = {}
+    inicio = 0
+    for lote in _lotes(documentos, BUNDLE_CHUNK_SIZE):
+        try:
+            await collection.insert_many(lote, ordered=False, session=session)
+        except BulkWriteError as e:
+            for err in e.details.get("writeErrors", []):
+                # 11000 = clave duplicada (índice único de identificadores)
+                status = "409 Conflict" if err.get("code") == 11000 else "500 Internal Server Error"
+                fallidos[inicio + err["index"]] = (status, err.get("errmsg", "Error de escritura"))
+        except (PyMongoError, InvalidDocument) as e:
+            # DocumentTooLarge deriva de InvalidDocument, no de PyMongoError
+            if isinstance(e, DocumentTooLarge):
+                status = "413 Payload Too Large"
+            else:
+                status = "500 Internal Server Error"
+            for j in range(len(lote)):
+                fallidos[inicio + j] = (status, f"No se pudo escribir el lote: {e}")
+        inicio += len(lote)
+    return fallidos
+
+
+async def procesar_batch(collection, entries):
+    """Bundle de tipo batch: cada entrada se procesa de forma independiente."""
+    respuestas = [None] * len(entries)
+    documentos, posiciones = [], []
+
+    for i, data in enumerate(await validar_entradas(entries)):
+        if isinstance(data, Exception):
+            respuestas[i] = _respuesta_error("400 Bad Request", str(data))
+        else:
+            documentos.append(data)
+            posiciones.append(i)
+
+    fallidos = await _insertar_sin_orden(collection, documentos)
+    for j, (i, doc) in enumerate(zip(posiciones, documentos)):
+        if j in fallidos:
+            respuestas[i] = _respuesta_error(*fallidos[j])
+        else:
+            registrar_escritura(doc)
+            respuestas[i] = _respuesta_creada(doc["_id"])
+
+    return {"resourceType": "Bundle", "type": "batch-response", "entry": respuestas}
+
+
+async def procesar_transaction(client, collection, entries):
+    """
+    Bundle de tipo transaction: todo o nada. Si alguna entrada no valida
+    no se escribe nada; las escrituras se hacen en una transacción de MongoDB.
+    """
+    documentos = await validar_entradas(entries)
+    for i, data in enumerate(documentos):
+        if isinstance(data, Exception):
+            raise BundleError(f"entry[{i}]: {data}")
+
+    async with await client.start_session() as session:
+        async with session.start_transaction():
+            for lote in _lotes(documentos, BUNDLE_CHUNK_SIZE):
+                await collection.insert_many(lote, ordered=False, session=session)
+
+    for doc in documentos:
+        registrar_escritura(doc)
+    return {
+        "resourceType": "Bundle",
+        "type": "transaction-response",
+        "entry": [_respuesta_creada(doc["_id"]) for doc in documentos],
+    }
+
+
+async def procesar_bundle(client, collection, bundle):
+    if bundle.get("resourceType") != "Bundle":
+        raise BundleError("Se esperaba un recurso Bundle")
+    entries = bundle.get("entry") or []
+    tipo = bundle.get("type")
+    if tipo == "batch":
+        return await procesar_batch(collection, entries)
+    if tipo == "transaction":
+        return await procesar_transaction(client, collection, entries)
+    raise BundleError(f"Tipo de Bundle no soportado: {tipo}")
@@ -0,0 +1,204 @@
+import re
+from datetime import date, timedelta
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING
+
+from app.controlador.db import COLLECTION_NAME
+from app.controlador.indices import registrar_consulta, registrar_indice
+from app.controlador.tokens import PROYECCION_PUBLICA, filtro_prefijo
+
+# Tamaño de página por defecto y máximo para _count
+DEFAULT_COUNT = 20
+MAX_COUNT = 100
+
+_PREFIJOS_FECHA = ("eq", "ge", "le", "gt", "lt")
+_FECHA = re.compile(r"^\d{4}(-\d{2}(-\d{2})?)?$")
+# dateTime de FHIR (p. ej. authored de ServiceRequest)
+FECHA_HORA = re.compile(r"^\d{4}(-\d{2}(-\d{2}(T[0-9:.]+(Z|[+-]\d{2}:\d{2})?)?)?)?$")
+
+
+class SearchParameterError(ValueError):
+    """Parámetro de búsqueda inválido o no soportado."""
+
+
+def _siguiente(fecha):
+    """
+    Inicio del periodo siguiente a una fecha parcial: '1980' -> '1981',
+    '1980-12' -> '1981-01', '1980-02-28' -> '1980-02-29'. Con hora la
+    fecha ya es un instante y no hay periodo: devuelve None.
+    """
+    if "T" in fecha:
+        return None
+    partes = [int(p) for p in fecha.split("-")]
+    if len(partes) == 1:
+        return f"{partes[0] + 1:04d}"
+    if len(partes) == 2:
+        if not 1 <= partes[1] <= 12:
+            raise ValueError(f"mes inválido: {fecha}")
+        anio, mes = partes[0] + partes[1] // 12, partes[1] % 12 + 1
+        return f"{anio:04d}-{mes:02d}"
+    return (date(*partes) + timedelta(days=1)).isoformat()
+
+
+def _rango_fecha(prefijo, fecha):
+    """
+    Una fecha parcial es el periodo [fecha, siguiente): birthdate=1980 es
+    todo 1980 y le1980-05 incluye 1980-05-15. Como las fechas se guardan
+    como texto ISO, los límites se comparan como cadenas.
+    """
+    fin = _siguiente(fecha)
+    if fin is None:
+        operador = {"eq": "$eq", "ge": "$gte", "le": "$lte", "gt": "$gt", "lt": "$lt"}[prefijo]
+        return {operador: fecha}
+    return {
+        "eq": {"$gte": fecha, "$lt": fin},
+        "ge": {"$gte": fecha},
+        "gt": {"$gte": fin},
+        "le": {"$lt": fin},
+        "lt": {"$lt": fecha},
+    }[prefijo]
+
+
+def filtro_fecha(campo, valores, parametro="birthdate", patron=_FECHA):
+    """
+    Filtro de MongoDB para un parámetro de fecha con prefijos (ge, lt...).
+    Cada valor es una condición aparte: repetir un prefijo no reemplaza al
+    anterior, todas deben cumplirse.
+    """
+    condiciones = []
+    for valor in valores:
+        prefijo, fecha = "eq", valor
+        if valor[:2] in _PREFIJOS_FECHA:
+            prefijo, fecha = valor[:2], valor[2:]
+        if not patron.match(fecha):
+            raise SearchParameterError(f"{parametro} inválido: {valor!r}")
+        try:
+            condiciones.append({campo: _rango_fecha(prefijo, fecha)})
+        except ValueError:
+            raise SearchParameterError(f"{parametro} inválido: {valor!r}")
+    return condiciones[0] if len(condiciones) == 1 else {"$and": condiciones}
+
+
+def _filtro_identifier(valor):
+    """
+    system|value, |value (sin system) o value (cualquier system). Las dos
+    últimas formas usan el índice de identifier.value.
+    """
+    if "|" in valor:
+        system, value = valor.split("|", 1)
+        if system:
+            return {"$elemMatch": {"system": system, "value": value}}
+        return {"$elemMatch": {"value": value, "system": {"$exists": False}}}
+    return {"$elemMatch": {"value": valor}}
+
+
+def construir_filtro(params):
+    """
+    Traduce los parámetros de búsqueda FHIR de Patient a un filtro de MongoDB.
+    `params` es un MultiDict (request.query_params).
+    """
+    condiciones = []
+    # Los nombres se buscan por prefijo sobre los tokens normalizados
+    # (sin tildes ni mayúsculas) que se calculan al escribir.
+    for valor in params.getlist("name"):
+        condiciones.append(filtro_prefijo("name", valor))
+    for valor in params.getlist("family"):
+        condiciones.append(filtro_prefijo("family", valor))
+    for valor in params.getlist("given"):
+        condiciones.append(filtro_prefijo("given", valor))
+    for valor in params.getlist("gender"):
+        condiciones.append({"gender": valor})
+    fechas = params.getlist("birthdate")
+    if fechas:
+        condiciones.append(filtro_fecha("birthDate", fechas))
+    for valor in params.getlist("identifier"):
+        condiciones.append({"identifier": _filtro_identifier(valor)})
+
+    if not condiciones:
+        return {}
+    if len(condiciones) == 1:
+        return condiciones[0]
+    return {"$and": condiciones}
+
+
+def leer_count(params):
+    try:
+        count = int(params.get("_count", DEFAULT_COUNT))
+    except ValueError:
+        raise SearchParameterError("_count debe ser un entero")
+    return max(1, min(count, MAX_COUNT))
+
+
+def leer_cursor(params):
+    """Devuelve el _id a partir del cual continuar (paginación por clave)."""
+    after = params.get("_after")
+    if after is None:
+        return None
+    try:
+        return ObjectId(after)
+    except (InvalidId, TypeError):
+        raise SearchParameterError(f"_after inválido: {after!r}")
+
+
+async def buscar_pacientes(collection, params):
+    """
+    Ejecuta la búsqueda con paginación por clave sobre _id: cada página
+    empieza en `_id > último _id`, de modo que el costo no crece con la
+    profundidad (a diferencia de skip).
+    Devuelve (documentos, hay_mas).
+    """
+    filtro = construir_filtro(params)
+    count = leer_count(params)
+    after = leer_cursor(params)
+    if after is not None:
+        filtro = {"$and": [filtro, {"_id": {"$gt": after}}]} if filtro else {"_id": {"$gt": after}}
+
+    # Se pide un documento extra para saber si hay página siguiente
+    cursor = collection.find(filtro, PROYECCION_PUBLICA).sort("_id", ASCENDING).limit(count + 1)
+    documentos = await cursor.to_list(length=count + 1)
+    return documentos[:count], len(documentos) > count
+
+
+def construir_bundle(documentos, hay_mas, url, tipo="Patient", cursor=None):
+    """
+    Arma el Bundle searchset con los enlaces self y next. `cursor` da el
+    valor de `_after` a partir del último documento (por defecto su _id).
+    """
+    links = [{"relation": "self", "url": str(url)}]
+    if hay_mas and documentos:
+        after = cursor(documentos[-1]) if cursor else str(documentos[-1]["_id"])
+        siguiente = url.include_query_params(_after=after)
+        links.append({"relation": "next", "url": str(siguiente)})
+    return {
+        "resourceType": "Bundle",
+        "type": "searchset",
+        "link": links,
+        "entry": [
+            {
+                "fullUrl": f"{tipo}/{doc['_id']}",
+                "resource": doc,
+                "search": {"mode": "match"},
+            }
+            for doc in documentos
+        ],
+    }
+
+
+# --- Índices de los parámetros de búsqueda ---
+# Cada índice termina en _id para que el orden de la paginación salga del índice.
+# Los índices de nombre están en tokens.py.
+for campo in ("gender", "birthDate"):
+    registrar_indice(COLLECTION_NAME, [(campo, ASCENDING), ("_id", ASCENDING)], name=f"search_{campo}_id")
+
+registrar_consulta(COLLECTION_NAME, "search_gender", {"gender": "male"}, sort=[("_id", ASCENDING)])
+registrar_consulta(COLLECTION_NAME, "search_birthdate", {"birthDate": {"$gte": "1980-01-01"}}, sort=[("_id", ASCENDING)])
+
+# identifier=value sin system: el índice (system, value) no sirve sin system
+registrar_indice(
+    COLLECTION_NAME, [("identifier.value", ASCENDING), ("_id", ASCENDING)], name="search_identifier_value_id"
+)
+registrar_consulta(
+    COLLECTION_NAME, "search_identifier_value", {"identifier": _filtro_identifier("0")}, sort=[("_id", ASCENDING)]
+)
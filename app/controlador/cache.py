@@ -0,0 +1,108 @@
+import os
+import time
+from collections import OrderedDict
+
+# Número máximo de pacientes en caché por worker (0 la desactiva)
+PATIENT_CACHE_SIZE = int(os.getenv("PATIENT_CACHE_SIZE", "1024"))
+# Segundos que una entrada se considera válida
+PATIENT_CACHE_TTL = float(os.getenv("PATIENT_CACHE_TTL", "30"))
+
+
+def identifier_key(system, value):
+    return f"{system}|{value}"
+
+
+class PatientCache:
+    """
+    Caché LRU con TTL para pacientes, en memoria del worker.
+
+    Las entradas se guardan por _id; cada identificador (system|value) del
+    paciente es un alias que apunta al mismo _id, de modo que una búsqueda
+    por id y otra por identificador comparten la misma entrada.
+    """
+
+    def __init__(self, maxsize=PATIENT_CACHE_SIZE, ttl=PATIENT_CACHE_TTL, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entradas = OrderedDict()  # _id -> (expira, paciente, alias)
+        self._alias = {}                # system|value -> _id
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def _quitar(self, patient_id):
+        _, _, alias = self._entradas.pop(patient_id)
+        for clave in alias:
+            if self._alias.get(clave) == patient_id:
+                del self._alias[clave]
+
+    def get_by_id(self, patient_id):
+        entrada = self._entradas.get(patient_id)
+        if entrada is None:
+            self.misses += 1
+            return None
+        if entrada[0] <= self._clock():
+            self._quitar(patient_id)
+            self.misses += 1
+            return None
+        self._entradas.move_to_end(patient_id)
+        self.hits += 1
+        return entrada[1]
+
+    def get_by_identifier(self, system, value):
+        patient_id = self._alias.get(identifier_key(system, value))
+        if patient_id is None:
+            self.misses += 1
+            return None
+        return self.get_by_id(patient_id)
+
+    def put(self, patient):
+        """Guarda un paciente tal como viene de MongoDB (el _id puede ser ObjectId)."""
+        if self.maxsize <= 0:
+            return
+        patient_id = str(patient["_id"])
+        if patient_id in self._entradas:
+            self._quitar(patient_id)
+        alias = [
+            identifier_key(ident.get("system"), ident.get("value"))
+            for ident in patient.get("identifier", [])
+            if isinstance(ident, dict)
+        ]
+        self._entradas[patient_id] = (self._clock() + self.ttl, patient, alias)
+        for clave in alias:
+            self._alias[clave] = patient_id
+        while len(self._entradas) > self.maxsize:
+            self._quitar(next(iter(self._entradas)))
+            self.evictions += 1
+
+    def invalidate(self, patient_id=None, identifiers=()):
+        """Invalida por _id y/o por una lista de identificadores FHIR."""
+        if patient_id in self._entradas:
+            self._quitar(patient_id)
+        for ident in identifiers:
+            alias_id = self._alias.get(identifier_key(ident.get("system"), ident.get("value")))
+            if alias_id in self._entradas:
+                self._quitar(alias_id)
+
+    def clear(self):
+        self._entradas.clear()
+        self._alias.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entradas),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+patient_cache = PatientCache()
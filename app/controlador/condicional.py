@@ -0,0 +1,67 @@
+from urllib.parse import parse_qsl
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.controlador.tokens import clave_identificador, claves_identificador
+
+
+class ConditionalCreateError(ValueError):
+    """Cabecera If-None-Exist inválida o no soportada."""
+
+
+def leer_if_none_exist(cabecera):
+    """
+    Interpreta `If-None-Exist: identifier=system|value` y devuelve (system, value).
+    Solo se admite el parámetro identifier, que es el que tiene índice.
+    """
+    params = parse_qsl(cabecera.lstrip("?"), keep_blank_values=True)
+    if len(params) != 1 or params[0][0] != "identifier":
+        raise ConditionalCreateError("If-None-Exist solo admite 'identifier=system|value'")
+    valor = params[0][1]
+    if "|" not in valor:
+        raise ConditionalCreateError("identifier debe tener la forma system|value")
+    system, value = valor.split("|", 1)
+    if not system or not value:
+        raise ConditionalCreateError("identifier debe incluir system y value")
+    return system, value
+
+
+def exigir_identificador(data, system, value):
+    """El recurso debe traer el identificador de If-None-Exist; si no, el índice único no lo protege."""
+    if clave_identificador(system, value) not in claves_identificador(data):
+        raise ConditionalCreateError("El recurso debe incluir el identificador de If-None-Exist")
+
+
+async def crear_si_no_existe(collection, data, system, value, session=None):
+    """
+    Crea el paciente solo si no existe otro con ese identificador, en una
+    única operación atómica (find_one_and_update con upsert).
+    Devuelve (_id, creado).
+
+    El filtro va sobre `_search.identifier`. Con su índice único
+    (PATIENT_IDENTIFIER_UNIQUE) si dos upserts simultáneos no encuentran
+    nada, el segundo insert recibe DuplicateKeyError y se devuelve el
+    paciente del ganador; sin él, ambos podrían insertar. $elemMatch
+    evita que el upsert siembre el campo desde el filtro, lo que chocaría
+    con el `_search` de $setOnInsert.
+    """
+    filtro = {"_search.identifier": {"$elemMatch": {"$eq": clave_identificador(system, value)}}}
+    nuevo_id = ObjectId()
+    try:
+        existente = await collection.find_one_and_update(
+            filtro,
+            {"$setOnInsert": dict(data, _id=nuevo_id)},
+            upsert=True,
+            projection={"_id": 1},
+            return_document=ReturnDocument.BEFORE,
+            session=session,
+        )
+    except DuplicateKeyError:
+        existente = await collection.find_one(filtro, projection={"_id": 1}, session=session)
+        if existente is None:
+            raise
+    if existente is None:
+        return nuevo_id, True
+    return existente["_id"], False
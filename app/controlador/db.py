@@ -0,0 +1,135 @@
+import os
+import threading
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+from pymongo.server_api import ServerApi
+
+from app.controlador.metricas import command_metrics
+
+# --- Configuración de conexión y del pool ---
+MONGO_URI = os.getenv("MONGO_URI")
+DB_NAME = os.getenv("MONGO_DB_NAME", "RIS-FINAL")
+COLLECTION_NAME = os.getenv("MONGO_COLLECTION", "solicitud")
+# ServiceRequest en su propia colección: las consultas de pacientes no
+# filtran por resourceType
+SERVICE_REQUEST_COLLECTION = os.getenv("MONGO_SERVICE_REQUEST_COLLECTION", "service_request")
+
+# Con 4 workers el total de conexiones es 4 x MONGO_MAX_POOL_SIZE (más las de
+# monitoreo); debe quedar por debajo del límite del tier de Atlas.
+POOL_SETTINGS = {
+    "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "50")),
+    "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+    "maxConnecting": int(os.getenv("MONGO_MAX_CONNECTING", "2")),
+    "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000")),
+    "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000")),
+    "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+    "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+    "socketTimeoutMS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "30000")),
+}
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """
+    Acumula estadísticas del pool de conexiones a partir de los eventos
+    de pymongo. Los eventos llegan desde hilos del driver, de ahí el lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connections_open = 0
+            self.connections_created = 0
+            self.connections_closed = 0
+            self.checked_out = 0
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.checkout_wait_total = 0.0
+            self.checkout_wait_max = 0.0
+            self.pools_cleared = 0
+
+    def _espera(self, event):
+        # `duration` (segundos) existe en los eventos de checkout desde pymongo 4.7
+        duracion = getattr(event, "duration", None)
+        if duracion is not None:
+            self.checkout_wait_total += duracion
+            self.checkout_wait_max = max(self.checkout_wait_max, duracion)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pools_cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_open += 1
+            self.connections_created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_open -= 1
+            self.connections_closed += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+            self._espera(event)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checked_out += 1
+            self.checkouts += 1
+            self._espera(event)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "connections_open": self.connections_open,
+                "connections_created": self.connections_created,
+                "connections_closed": self.connections_closed,
+                "checked_out": self.checked_out,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "wait_queue_ms_avg": round(self.checkout_wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "wait_queue_ms_max": round(self.checkout_wait_max * 1000, 3),
+                "pools_cleared": self.pools_cleared,
+            }
+
+
+pool_stats = PoolStatsListener()
+
+
+def crear_cliente(**opciones):
+    """
+    Crea el cliente de MongoDB. Debe llamarse dentro de cada worker (lifespan
+    o post_fork), nunca antes del fork: un MongoClient no es seguro de
+    compartir entre procesos.
+    """
+    settings = dict(POOL_SETTINGS, **opciones)
+    return AsyncIOMotorClient(
+        MONGO_URI,
+        server_api=ServerApi('1'),
+        event_listeners=[pool_stats, command_metrics],
+        **settings,
+    )
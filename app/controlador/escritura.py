@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import os
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# WRITE_MODE:
+#   "direct": un insert_one por solicitud (comportamiento original)
+#   "batch":  micro-lotes; cada solicitud espera el ack de su lote
+#   "async":  micro-lotes; se responde 202 sin esperar el ack. Lo que esté en
+#             cola se pierde si el worker muere antes del flush.
+WRITE_MODE = os.getenv("WRITE_MODE", "direct").lower()
+# Tamaño máximo del lote y espera máxima antes de enviarlo
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "100"))
+WRITE_BATCH_DELAY_MS = float(os.getenv("WRITE_BATCH_DELAY_MS", "5"))
+
+
+class WriteBatcher:
+    """
+    Agrupa los inserts de solicitudes concurrentes en un solo insert_many.
+
+    El lote se envía cuando llega a `max_batch` documentos o cuando pasan
+    `max_delay_ms` desde el primer documento, lo que ocurra antes. Cada
+    solicitud recibe su propio _id o su propio error.
+    """
+
+    def __init__(self, collection, max_batch=WRITE_BATCH_SIZE, max_delay_ms=WRITE_BATCH_DELAY_MS):
+        self.collection = collection
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self._pendientes = []
+        self._temporizador = None
+        self._envios = set()
+        self.batches = 0
+        self.documents = 0
+
+    def _encolar(self, data):
+        data.setdefault("_id", ObjectId())
+        futuro = asyncio.get_running_loop().create_future()
+        self._pendientes.append((data, futuro))
+        if len(self._pendientes) >= self.max_batch:
+            self._enviar()
+        elif self._temporizador is None:
+            self._temporizador = asyncio.get_running_loop().call_later(self.max_delay, self._enviar)
+        return futuro
+
+    def _enviar(self):
+        if self._temporizador is not None:
+            self._temporizador.cancel()
+            self._temporizador = None
+        if not self._pendientes:
+            return
+        lote, self._pendientes = self._pendientes, []
+        tarea = asyncio.ensure_future(self._insertar(lote))
+        self._envios.add(tarea)
+        tarea.add_done_callback(self._envios.discard)
+
+    async def _insertar(self, lote):
+        self.batches += 1
+        self.documents += len(lote)
+        errores = {}
+        try:
+            await self.collection.insert_many([data for data, _ in lote], ordered=False)
+        except BulkWriteError as e:
+            for err in e.details.get("writeErrors", []):
+                mensaje = err.get("errmsg", "Error de escritura")
+                # 11000 = clave duplicada: se propaga como en insert_one
+                if err.get("code") == 11000:
+                    errores[err["index"]] = DuplicateKeyError(mensaje, 11000)
+                else:
+                    errores[err["index"]] = RuntimeError(mensaje)
+        except Exception as e:
+            errores = {i: RuntimeError(str(e)) for i in range(len(lote))}
+
+        for i, (data, futuro) in enumerate(lote):
+            if futuro.done():
+                continue
+            if i in errores:
+                futuro.set_exception(errores[i])
+            else:
+                futuro.set_result(data["_id"])
+
+    async def insertar(self, data):
+        """Inserta en el próximo lote y espera su confirmación. Devuelve el _id."""
+        return await self._encolar(data)
+
+    def aceptar(self, data):
+        """
+        Encola el documento sin esperar la confirmación y devuelve su _id.
+        Los errores solo quedan en el log.
+        """
+        futuro = self._encolar(data)
+        futuro.add_done_callback(self._registrar_error)
+        return data["_id"]
+
+    @staticmethod
+    def _registrar_error(futuro):
+        if not futuro.cancelled() and futuro.exception() is not None:
+            logger.error("Fallo en escritura asíncrona de paciente: %s", futuro.exception())
+
+    async def cerrar(self):
+        """Envía lo pendiente y espera los lotes en curso (apagado del worker)."""
+        self._enviar()
+        if self._envios:
+            await asyncio.gather(*self._envios, return_exceptions=True)
+
+    def stats(self):
+        return {
+            "mode": WRITE_MODE,
+            "batches": self.batches,
+            "documents": self.documents,
+            "avg_batch_size": round(self.documents / self.batches, 2) if self.batches else 0.0,
+            "pending": len(self._pendientes),
+        }
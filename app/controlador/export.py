@@ -0,0 +1,39 @@
+import os
+
+from app.controlador.serializacion import dumps
+from app.controlador.tokens import PROYECCION_PUBLICA
+
+# Documentos por lote que el cursor pide al servidor
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+# Bytes acumulados antes de entregar un bloque a la respuesta
+EXPORT_CHUNK_BYTES = int(os.getenv("EXPORT_CHUNK_BYTES", str(64 * 1024)))
+
+
+def documento_a_ndjson(doc):
+    return dumps(doc) + b"\n"
+
+
+async def generar_ndjson(collection, filtro=None, batch_size=None):
+    """
+    Recorre el cursor y produce bloques NDJSON.
+
+    Solo hay en memoria un lote del cursor y un bloque de salida a la vez.
+    StreamingResponse espera a que cada bloque se envíe antes de pedir el
+    siguiente, así que un cliente lento frena la lectura del cursor
+    (contrapresión) en lugar de acumular datos en el worker.
+    """
+    cursor = collection.find(filtro or {}, PROYECCION_PUBLICA, batch_size=batch_size or EXPORT_BATCH_SIZE)
+    buffer = bytearray()
+
+    try:
+        async for doc in cursor:
+            buffer += documento_a_ndjson(doc)
+            if len(buffer) >= EXPORT_CHUNK_BYTES:
+                bloque = bytes(buffer)
+                buffer.clear()
+                yield bloque
+        if buffer:
+            yield bytes(buffer)
+    finally:
+        # Si el cliente corta la conexión se libera el cursor en el servidor
+        await cursor.close()
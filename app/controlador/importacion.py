@@ -0,0 +1,340 @@
+"""
+Importación masiva de pacientes desde un archivo NDJSON o un Bundle FHIR.
+
+El archivo se lee con mmap: el proceso principal solo ubica los límites de
+cada registro y envía lotes de bytes a un pool de procesos, que parsea,
+valida con fhir.resources y calcula los campos de escritura (meta, tokens,
+claves MPI). Los lotes validados se escriben con insert_many sin orden.
+Como mucho hay `--en-vuelo` lotes en memoria, sea cual sea el tamaño del
+archivo.
+
+Reanudación: tras cada lote escrito se guarda en el checkpoint el offset
+del siguiente registro pendiente (los lotes se confirman en orden). El _id
+de cada paciente se deriva de la semilla del checkpoint y del offset del
+registro, así que un lote que se repite tras una interrupción choca con
+sus propios _id y se cuenta como ya importado en lugar de duplicarse.
+
+Los registros rechazados se escriben en `<archivo>.rechazos.ndjson` con su
+offset y el motivo.
+
+    MONGO_URI=... python -m app.controlador.importacion pacientes.ndjson --procesos 8
+    MONGO_URI=... python -m app.controlador.importacion bundle.json --formato bundle
+"""
+import argparse
+import asyncio
+import hashlib
+import mmap
+import os
+import re
+import secrets
+import struct
+import time
+from collections import deque
+
+import orjson
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from app.controlador.procesos import crear_pool
+from app.controlador.validacion import preparar_documento, prevalidar, validar_completo
+
+# Registros por lote de validación e insert_many
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+
+_ESPACIOS = re.compile(rb"\s*")
+_INICIO_ENTRY = re.compile(rb'"entry"\s*:\s*\[')
+# Bytes que cambian la profundidad o abren una cadena
+_ESTRUCTURA = re.compile(rb'[{}\[\]"]')
+# Resto de una cadena JSON hasta su comilla de cierre (salta los escapes)
+_FIN_CADENA = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+
+
+class ImportacionError(ValueError):
+    """El archivo o el checkpoint no permiten importar."""
+
+
+# --- Lectura ---
+
+def leer_ndjson(mm, inicio=0):
+    """Produce (offset, bytes, offset siguiente) por cada línea no vacía."""
+    pos, fin = inicio, len(mm)
+    while pos < fin:
+        salto = mm.find(b"\n", pos)
+        siguiente = fin if salto == -1 else salto + 1
+        crudo = mm[pos:siguiente].strip()
+        if crudo:
+            yield pos, crudo, siguiente
+        pos = siguiente
+
+
+def _fin_objeto(mm, pos):
+    """
+    Offset del final del objeto JSON que empieza en `pos`.
+
+    Recorre los bytes sin decodificarlos: solo cuenta llaves y corchetes, y
+    salta el contenido de las cadenas (donde pueden aparecer). El objeto se
+    parsea de verdad después, en el pool; aquí solo se ubican sus límites.
+    """
+    if mm[pos:pos + 1] != b"{":
+        raise ImportacionError(f"Se esperaba un objeto en el offset {pos}")
+    profundidad = 0
+    i = pos
+    while True:
+        encontrado = _ESTRUCTURA.search(mm, i)
+        if encontrado is None:
+            break
+        i = encontrado.end()
+        byte = encontrado.group()
+        if byte == b'"':
+            cadena = _FIN_CADENA.match(mm, i)
+            if cadena is None:
+                break
+            i = cadena.end()
+        elif byte in b"{[":
+            profundidad += 1
+        else:
+            profundidad -= 1
+            if profundidad == 0:
+                return i
+    raise ImportacionError(f"Entrada del Bundle incompleta en el offset {pos}")
+
+
+def leer_bundle(mm, inicio=0):
+    """
+    Produce (offset, bytes, offset siguiente) por cada elemento de Bundle.entry.
+    Con inicio=0 se busca el arreglo entry; al reanudar, `inicio` ya apunta a
+    un elemento.
+    """
+    if inicio == 0:
+        encontrado = _INICIO_ENTRY.search(mm)
+        if encontrado is None:
+            return
+        inicio = encontrado.end()
+    pos = _ESPACIOS.match(mm, inicio).end()
+    while pos < len(mm) and mm[pos:pos + 1] != b"]":
+        fin = _fin_objeto(mm, pos)
+        siguiente = _ESPACIOS.match(mm, fin).end()
+        if mm[siguiente:siguiente + 1] == b",":
+            siguiente = _ESPACIOS.match(mm, siguiente + 1).end()
+        yield pos, mm[pos:fin], siguiente
+        pos = siguiente
+
+
+LECTORES = {"ndjson": leer_ndjson, "bundle": leer_bundle}
+
+
+def detectar_formato(ruta):
+    return "bundle" if ruta.lower().endswith(".json") else "ndjson"
+
+
+def lotes(registros, tamano):
+    lote = []
+    for registro in registros:
+        lote.append(registro)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+# --- Validación (en el pool) ---
+
+def procesar_registros(formato, registros):
+    """
+    Corre en el proceso hijo: parsea y valida cada registro. Devuelve
+    (offset, True, documento) o (offset, False, motivo).
+    """
+    salida = []
+    for offset, crudo in registros:
+        try:
+            recurso = orjson.loads(crudo)
+            if formato == "bundle":
+                recurso = recurso.get("resource") if isinstance(recurso, dict) else None
+            prevalidar(recurso)
+            salida.append((offset, True, preparar_documento(validar_completo(recurso))))
+        except Exception as e:
+            salida.append((offset, False, str(e)))
+    return salida
+
+
+def id_determinista(semilla, epoch, offset):
+    """ObjectId estable para un registro: timestamp del checkpoint + hash del offset."""
+    resumen = hashlib.blake2b(f"{semilla}:{offset}".encode(), digest_size=8).digest()
+    return ObjectId(struct.pack(">I", epoch) + resumen)
+
+
+# --- Checkpoint ---
+
+def cargar_checkpoint(ruta_checkpoint, archivo, tamano, reiniciar=False):
+    if not reiniciar and os.path.exists(ruta_checkpoint):
+        with open(ruta_checkpoint, "rb") as f:
+            estado = orjson.loads(f.read())
+        if estado["tamano"] != tamano:
+            raise ImportacionError(
+                f"El archivo cambió desde el checkpoint ({estado['tamano']} -> {tamano} bytes); use --reiniciar"
+            )
+        return estado
+    return {
+        "archivo": os.path.abspath(archivo),
+        "tamano": tamano,
+        "offset": 0,
+        "semilla": secrets.token_hex(8),
+        "epoch": int(time.time()),
+        "importados": 0,
+        "existentes": 0,
+        "rechazados": 0,
+        "completo": False,
+    }
+
+
+def guardar_checkpoint(ruta_checkpoint, estado):
+    temporal = ruta_checkpoint + ".tmp"
+    with open(temporal, "wb") as f:
+        f.write(orjson.dumps(estado))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta_checkpoint)
+
+
+# --- Escritura ---
+
+async def insertar_lote(collection, documentos):
+    """
+    insert_many sin orden. Devuelve (insertados, existentes, rechazos) donde
+    existentes son los _id ya escritos por una corrida anterior.
+    """
+    if not documentos:
+        return 0, 0, []
+    try:
+        await collection.insert_many(documentos, ordered=False)
+        return len(documentos), 0, []
+    except BulkWriteError as e:
+        errores = e.details.get("writeErrors", [])
+        existentes, rechazos = 0, []
+        for err in errores:
+            # 11000 sobre _id: el registro ya se importó antes de la interrupción
+            if err.get("code") == 11000 and "_id" in (err.get("keyPattern") or {}):
+                existentes += 1
+            else:
+                rechazos.append((documentos[err["index"]]["_id"], err.get("errmsg", "Error de escritura")))
+        return len(documentos) - len(errores), existentes, rechazos
+
+
+async def importar(collection, archivo, formato=None, checkpoint=None, rechazos=None, procesos=None,
+                   tamano_lote=IMPORT_BATCH_SIZE, en_vuelo=None, reiniciar=False, progreso=5.0):
+    formato = formato or detectar_formato(archivo)
+    checkpoint = checkpoint or archivo + ".checkpoint.json"
+    rechazos = rechazos or archivo + ".rechazos.ndjson"
+    procesos = procesos or os.cpu_count() or 1
+    en_vuelo = en_vuelo or procesos * 2
+
+    tamano = os.path.getsize(archivo)
+    estado = cargar_checkpoint(checkpoint, archivo, tamano, reiniciar)
+    if estado["completo"] or tamano == 0:
+        print(f"Nada que importar: {estado['importados']} pacientes ya importados")
+        return estado
+
+    loop = asyncio.get_running_loop()
+    inicio_corrida = ultimo_reporte = time.monotonic()
+    procesados_corrida = procesados_reporte = 0
+
+    async def procesar(lote):
+        resultados = await loop.run_in_executor(
+            pool, procesar_registros, formato, [(offset, crudo) for offset, crudo, _ in lote]
+        )
+        documentos, invalidos = [], []
+        for offset, ok, valor in resultados:
+            if ok:
+                valor["_id"] = id_determinista(estado["semilla"], estado["epoch"], offset)
+                documentos.append(valor)
+            else:
+                invalidos.append({"offset": offset, "error": valor})
+        insertados, existentes, fallidos = await insertar_lote(collection, documentos)
+        invalidos += [{"_id": str(patient_id), "error": motivo} for patient_id, motivo in fallidos]
+        return len(lote), insertados, existentes, invalidos
+
+    def reportar(final=False):
+        nonlocal ultimo_reporte, procesados_reporte
+        ahora = time.monotonic()
+        if not final and ahora - ultimo_reporte < progreso:
+            return
+        total = ahora - inicio_corrida
+        reciente = ahora - ultimo_reporte
+        print(
+            f"{estado['offset'] / tamano:6.1%}  importados={estado['importados']} "
+            f"existentes={estado['existentes']} rechazados={estado['rechazados']}  "
+            f"{procesados_corrida / total if total else 0:.0f} docs/s "
+            f"(último tramo {(procesados_corrida - procesados_reporte) / reciente if reciente else 0:.0f} docs/s)",
+            flush=True,
+        )
+        ultimo_reporte, procesados_reporte = ahora, procesados_corrida
+
+    with open(archivo, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+            crear_pool(procesos) as pool, open(rechazos, "ab") as salida_rechazos:
+        pendientes = deque()
+
+        async def confirmar():
+            # Los lotes se confirman en orden para que el offset guardado
+            # nunca salte un lote que aún no se escribió
+            nonlocal procesados_corrida
+            siguiente, tarea = pendientes.popleft()
+            leidos, insertados, existentes, invalidos = await tarea
+            for rechazo in invalidos:
+                salida_rechazos.write(orjson.dumps(rechazo) + b"\n")
+            salida_rechazos.flush()
+            estado["offset"] = siguiente
+            estado["importados"] += insertados
+            estado["existentes"] += existentes
+            estado["rechazados"] += len(invalidos)
+            guardar_checkpoint(checkpoint, estado)
+            procesados_corrida += leidos
+            reportar()
+
+        for lote in lotes(LECTORES[formato](mm, estado["offset"]), tamano_lote):
+            pendientes.append((lote[-1][2], asyncio.ensure_future(procesar(lote))))
+            while len(pendientes) >= en_vuelo:
+                await confirmar()
+        while pendientes:
+            await confirmar()
+
+    estado["completo"] = True
+    guardar_checkpoint(checkpoint, estado)
+    reportar(final=True)
+    return estado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("archivo")
+    parser.add_argument("--formato", choices=sorted(LECTORES), help="por defecto según la extensión (.json = bundle)")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--lote", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--en-vuelo", type=int, help="lotes en memoria a la vez (por defecto 2 por proceso)")
+    parser.add_argument("--checkpoint", help="por defecto <archivo>.checkpoint.json")
+    parser.add_argument("--rechazos", help="por defecto <archivo>.rechazos.ndjson")
+    parser.add_argument("--reiniciar", action="store_true", help="ignora el checkpoint y empieza desde el inicio")
+    parser.add_argument("--progreso", type=float, default=5.0, help="segundos entre reportes")
+    args = parser.parse_args()
+
+    from app.controlador.db import COLLECTION_NAME, DB_NAME, crear_cliente
+
+    async def ejecutar():
+        client = crear_cliente()
+        try:
+            estado = await importar(
+                client[DB_NAME][COLLECTION_NAME], args.archivo, args.formato, args.checkpoint, args.rechazos,
+                args.procesos, args.lote, args.en_vuelo, args.reiniciar, args.progreso,
+            )
+            print(
+                f"Importación terminada: {estado['importados']} importados, "
+                f"{estado['existentes']} ya existentes, {estado['rechazados']} rechazados"
+            )
+        finally:
+            client.close()
+
+    asyncio.run(ejecutar())
+
+
+if __name__ == "__main__":
+    main()
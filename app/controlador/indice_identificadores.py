@@ -0,0 +1,272 @@
+"""
+Índice de identificadores en memoria, por worker.
+
+Cada worker mantiene el mapa system|value -> _id de todos los pacientes. Se
+carga de la colección al arrancar y un change stream sobre `solicitud` lo
+mantiene al día. Con el índice listo, GET /patient/identifier responde el
+not-found sin ir a MongoDB y convierte los aciertos en lecturas por _id
+(que a su vez pasan por la caché de pacientes, donde viven las entradas
+calientes completas).
+
+El resume token del change stream se guarda junto con el mapa en
+IDENTIFIER_INDEX_SNAPSHOT al apagar el worker; al reiniciar se carga ese
+archivo y se reanuda el stream desde el token en lugar de recorrer la
+colección. Si el oplog ya no tiene ese punto, se recarga completo.
+
+Requiere un replica set (los change streams no existen en un mongod suelto).
+"""
+import asyncio
+import logging
+import os
+
+import orjson
+from bson import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.controlador.cache import identifier_key, patient_cache
+
+logger = logging.getLogger(__name__)
+
+# IDENTIFIER_INDEX=1 activa el índice; desactivado por defecto
+IDENTIFIER_INDEX = os.getenv("IDENTIFIER_INDEX", "0").lower() in ("1", "true", "on")
+# Archivo con el mapa y el resume token; vacío = no se guarda
+IDENTIFIER_INDEX_SNAPSHOT = os.getenv("IDENTIFIER_INDEX_SNAPSHOT", "")
+# Espera máxima de cada getMore del change stream
+IDENTIFIER_INDEX_AWAIT_MS = int(os.getenv("IDENTIFIER_INDEX_AWAIT_MS", "1000"))
+
+# ChangeStreamHistoryLost y ChangeStreamFatalError: el token ya no sirve
+_ERRORES_SIN_REANUDACION = {280, 286}
+# Eventos que cierran el stream (colección borrada o renombrada)
+_EVENTOS_INVALIDANTES = {"drop", "rename", "dropDatabase", "invalidate"}
+
+_PROYECCION = {"identifier.system": 1, "identifier.value": 1}
+_PIPELINE = [{"$project": {
+    "operationType": 1,
+    "documentKey": 1,
+    "fullDocument._id": 1,
+    "fullDocument.identifier.system": 1,
+    "fullDocument.identifier.value": 1,
+}}]
+
+
+def claves_identificador(doc):
+    """Claves system|value del documento; solo las que una consulta puede encontrar."""
+    return tuple(
+        identifier_key(ident["system"], ident["value"])
+        for ident in (doc or {}).get("identifier", [])
+        if isinstance(ident, dict) and isinstance(ident.get("system"), str) and isinstance(ident.get("value"), str)
+    )
+
+
+class IdentifierIndex:
+    """
+    Mapa system|value -> _id mantenido por un change stream.
+
+    Mientras `listo` es False (cargando o poniéndose al día con el stream)
+    el índice no debe usarse para responder not-found: las rutas consultan
+    a MongoDB como antes.
+    """
+
+    def __init__(self, snapshot=IDENTIFIER_INDEX_SNAPSHOT, max_await_ms=IDENTIFIER_INDEX_AWAIT_MS):
+        self.snapshot = snapshot
+        self.max_await_ms = max_await_ms
+        self._por_clave = {}   # system|value -> {_id}
+        self._por_id = {}      # _id -> (system|value, ...)
+        self._tarea = None
+        # Solo se mantiene el mapa entre iniciar() y detener(): con el índice
+        # apagado nadie lo lee y registrar las escrituras solo haría crecer memoria
+        self.activo = False
+        self.listo = False
+        self.resume_token = None
+        self.eventos = 0
+        self.recargas = 0
+        self.reconexiones = 0
+
+    def __len__(self):
+        return len(self._por_clave)
+
+    # --- Mapa ---
+
+    def registrar(self, doc):
+        """Añade o actualiza un paciente; también la usan las escrituras del propio worker."""
+        if not self.activo:
+            return
+        patient_id = doc["_id"]
+        self.quitar(patient_id)
+        claves = claves_identificador(doc)
+        if not claves:
+            return
+        self._por_id[patient_id] = claves
+        for clave in claves:
+            self._por_clave.setdefault(clave, set()).add(patient_id)
+
+    def quitar(self, patient_id):
+        for clave in self._por_id.pop(patient_id, ()):
+            ids = self._por_clave.get(clave)
+            if ids is None:
+                continue
+            ids.discard(patient_id)
+            if not ids:
+                del self._por_clave[clave]
+
+    def buscar(self, system, value):
+        """_id de un paciente con ese identificador, o None si no hay ninguno."""
+        ids = self._por_clave.get(identifier_key(system, value))
+        if not ids:
+            return None
+        # Con identificadores repetidos cualquiera es válido, igual que find_one
+        return min(ids, key=str)
+
+    def limpiar(self):
+        self._por_clave.clear()
+        self._por_id.clear()
+
+    # --- Carga y change stream ---
+
+    async def cargar(self, collection):
+        """
+        Recorre la colección y devuelve el operationTime previo al recorrido,
+        desde el que debe arrancar el change stream para no perder escrituras.
+        """
+        async with await collection.database.client.start_session() as session:
+            await collection.database.command("ping", session=session)
+            inicio = session.operation_time
+        self.limpiar()
+        async for doc in collection.find({"identifier": {"$exists": True}}, _PROYECCION):
+            self.registrar(doc)
+        self.recargas += 1
+        logger.info("Índice de identificadores cargado: %d claves", len(self._por_clave))
+        return inicio
+
+    def _aplicar(self, cambio):
+        self.eventos += 1
+        tipo = cambio["operationType"]
+        if tipo in _EVENTOS_INVALIDANTES:
+            return False
+        patient_id = cambio["documentKey"]["_id"]
+        if tipo in ("insert", "replace", "update"):
+            doc = cambio.get("fullDocument")
+            if doc:
+                self.registrar(doc)
+            else:
+                # updateLookup devuelve null si el documento se borró después
+                self.quitar(patient_id)
+        elif tipo == "delete":
+            self.quitar(patient_id)
+        if tipo != "insert":
+            # La caché de este worker podría tener la versión anterior
+            patient_cache.invalidate(str(patient_id))
+        return True
+
+    async def _seguir(self, collection):
+        inicio = None
+        if self.resume_token is None:
+            inicio = await self.cargar(collection)
+        while True:
+            opciones = {"resume_after": self.resume_token} if self.resume_token else {"start_at_operation_time": inicio}
+            try:
+                async with collection.watch(
+                    _PIPELINE, full_document="updateLookup", max_await_time_ms=self.max_await_ms, **opciones
+                ) as stream:
+                    while stream.alive:
+                        cambio = await stream.try_next()
+                        if cambio is not None and not self._aplicar(cambio):
+                            raise OperationFailure("change stream invalidado", code=280)
+                        self.resume_token = stream.resume_token
+                        if cambio is None and not self.listo:
+                            # Lote vacío: el índice ya está al día con el stream
+                            self.listo = True
+                            logger.info("Índice de identificadores listo")
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code not in _ERRORES_SIN_REANUDACION:
+                    raise
+                logger.warning("Change stream sin reanudación (%s); se recarga el índice", e)
+                self.listo = False
+                self.resume_token = None
+                inicio = await self.cargar(collection)
+            except PyMongoError as e:
+                # Error transitorio: se reanuda desde el último token sin recorrer la colección
+                self.reconexiones += 1
+                logger.warning("Change stream interrumpido (%s); reanudando", e)
+                await asyncio.sleep(1)
+
+    def iniciar(self, collection):
+        """Arranca la carga y el change stream en segundo plano."""
+        self.activo = True
+        self.cargar_snapshot()
+        self._tarea = asyncio.ensure_future(self._seguir(collection))
+        self._tarea.add_done_callback(self._terminada)
+
+    def _terminada(self, tarea):
+        self.listo = False
+        if not tarea.cancelled() and tarea.exception() is not None:
+            logger.error("El índice de identificadores se detuvo", exc_info=tarea.exception())
+
+    async def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._tarea = None
+        self.guardar_snapshot()
+        self.activo = False
+        self.limpiar()
+
+    # --- Snapshot en disco ---
+
+    def guardar_snapshot(self):
+        if not self.snapshot or self.resume_token is None:
+            return
+        datos = {
+            "resume_token": dict(self.resume_token),
+            "ids": {str(patient_id): claves for patient_id, claves in self._por_id.items()},
+        }
+        # Escritura atómica: varios workers pueden compartir el archivo
+        temporal = f"{self.snapshot}.{os.getpid()}.tmp"
+        with open(temporal, "wb") as f:
+            f.write(orjson.dumps(datos))
+        os.replace(temporal, self.snapshot)
+
+    def cargar_snapshot(self):
+        if not self.snapshot or not os.path.exists(self.snapshot):
+            return False
+        try:
+            with open(self.snapshot, "rb") as f:
+                datos = orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError) as e:
+            logger.warning("Snapshot del índice ilegible (%s); se recorrerá la colección", e)
+            return False
+        self.limpiar()
+        for texto, claves in datos["ids"].items():
+            patient_id = ObjectId(texto) if ObjectId.is_valid(texto) else texto
+            self._por_id[patient_id] = tuple(claves)
+            for clave in claves:
+                self._por_clave.setdefault(clave, set()).add(patient_id)
+        self.resume_token = datos["resume_token"]
+        return True
+
+    def stats(self):
+        return {
+            "enabled": IDENTIFIER_INDEX,
+            "ready": self.listo,
+            "keys": len(self._por_clave),
+            "patients": len(self._por_id),
+            "events": self.eventos,
+            "reloads": self.recargas,
+            "reconnects": self.reconexiones,
+        }
+
+
+indice_identificadores = IdentifierIndex()
+
+
+def registrar_escritura(doc):
+    """Pasos tras crear un paciente en este worker (POST /patient, creación condicional, Bundle)."""
+    # Un identificador en caché podría apuntar a otro paciente con el mismo valor
+    patient_cache.invalidate(identifiers=doc.get("identifier", []))
+    # Las escrituras propias se ven en el índice sin esperar al change stream
+    indice_identificadores.registrar(doc)
@@ -0,0 +1,162 @@
+import logging
+import os
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from app.controlador.db import COLLECTION_NAME
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración ---
+# INDEX_ENFORCEMENT: "error" (no arranca si una consulta hace COLLSCAN),
+# "warn" (solo registra una advertencia) u "off" (no verifica).
+INDEX_ENFORCEMENT = os.getenv("INDEX_ENFORCEMENT", "warn").lower()
+# Restricción única sobre system|value (índice de _search.identifier, ver
+# tokens.py), opcional: activarla solo si la colección no tiene duplicados.
+# Sin ella, dos creaciones condicionales simultáneas aún podrían insertar ambas.
+IDENTIFIER_UNIQUE = os.getenv("PATIENT_IDENTIFIER_UNIQUE", "false").lower() in ("1", "true", "yes")
+
+# --- Registro declarativo ---
+# Cada ruta que consulta la colección registra aquí los índices que necesita
+# y la forma de la consulta, para que el arranque cree los índices y
+# compruebe con explain() que la consulta los usa.
+_indices = {}
+_consultas = {}
+# Índices que una versión anterior creaba y ya no se usan: el arranque los
+# elimina para que no sigan costando en cada escritura
+_obsoletos = {}
+
+
+class IndexEnforcementError(RuntimeError):
+    """Una consulta registrada se resolvería con un recorrido completo de la colección."""
+
+
+def registrar_indice(collection_name, keys, **opciones):
+    """
+    Registra un índice para la colección indicada.
+    `keys` es una lista de tuplas (campo, dirección) como en pymongo.
+    """
+    modelo = IndexModel(keys, **opciones)
+    _indices.setdefault(collection_name, []).append(modelo)
+    return modelo
+
+
+def registrar_indice_obsoleto(collection_name, nombre):
+    """Registra el nombre de un índice que debe eliminarse si existe."""
+    _obsoletos.setdefault(collection_name, set()).add(nombre)
+
+
+def registrar_consulta(collection_name, nombre, filtro, sort=None):
+    """
+    Registra la forma de una consulta que debe resolverse con un índice.
+    Los valores del filtro son de ejemplo; solo importa la forma.
+    """
+    _consultas.setdefault(collection_name, {})[nombre] = (filtro, sort)
+
+
+def _etapas(plan):
+    """Recorre recursivamente un plan de explain() y devuelve sus etapas."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for valor in plan.values():
+            yield from _etapas(valor)
+    elif isinstance(plan, list):
+        for valor in plan:
+            yield from _etapas(valor)
+
+
+# Opciones que, si cambian, obligan a recrear un índice con el mismo nombre
+_OPCIONES = ("unique", "sparse", "partialFilterExpression")
+
+
+def _opciones_distintas(modelo, existente):
+    # unique=False equivale a no tenerlo; index_information() no lo incluye
+    return any((modelo.document.get(k) or None) != (existente.get(k) or None) for k in _OPCIONES)
+
+
+async def eliminar_obsoletos(collection):
+    """
+    Elimina los índices obsoletos registrados y los que existen con el
+    nombre de uno registrado pero con otras opciones (p. ej. el unique que
+    tenía identifier_system_value), que create_indexes rechazaría.
+    """
+    existentes = await collection.index_information()
+    obsoletos = set(_obsoletos.get(collection.name, set()))
+    for modelo in _indices.get(collection.name, []):
+        nombre = modelo.document["name"]
+        if nombre in existentes and _opciones_distintas(modelo, existentes[nombre]):
+            obsoletos.add(nombre)
+    eliminados = []
+    for nombre in sorted(obsoletos & set(existentes)):
+        try:
+            await collection.drop_index(nombre)
+        except OperationFailure as e:
+            # 27 = IndexNotFound: otro worker lo eliminó primero
+            if e.code != 27:
+                raise
+        eliminados.append(nombre)
+    if eliminados:
+        logger.info("Índices obsoletos eliminados en '%s': %s", collection.name, ", ".join(eliminados))
+    return eliminados
+
+
+async def asegurar_indices(collection):
+    """Crea (si no existen) los índices registrados para la colección."""
+    await eliminar_obsoletos(collection)
+    modelos = _indices.get(collection.name, [])
+    if not modelos:
+        return []
+    nombres = await collection.create_indexes(modelos)
+    logger.info("Índices asegurados en '%s': %s", collection.name, ", ".join(nombres))
+    return nombres
+
+
+async def verificar_consultas(collection, modo=None):
+    """
+    Ejecuta explain() sobre cada consulta registrada y detecta las que
+    harían COLLSCAN. Según el modo lanza IndexEnforcementError o advierte.
+    """
+    modo = modo or INDEX_ENFORCEMENT
+    if modo == "off":
+        return []
+
+    sin_indice = []
+    for nombre, (filtro, sort) in _consultas.get(collection.name, {}).items():
+        cursor = collection.find(filtro).limit(1)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = await cursor.explain()
+        etapas = set(_etapas(plan.get("queryPlanner", {}).get("winningPlan", {})))
+        if "COLLSCAN" in etapas:
+            sin_indice.append(nombre)
+
+    if sin_indice:
+        mensaje = f"Consultas sin índice en '{collection.name}': {', '.join(sin_indice)}"
+        if modo == "error":
+            raise IndexEnforcementError(mensaje)
+        logger.warning(mensaje)
+    return sin_indice
+
+
+async def inicializar_indices(collection, modo=None):
+    """Punto de entrada del arranque: crea los índices y verifica las consultas."""
+    await asegurar_indices(collection)
+    return await verificar_consultas(collection, modo)
+
+
+# --- Índices de la colección de pacientes ---
+# Sirve las búsquedas por identifier; la unicidad va en el índice de
+# _search.identifier (tokens.py), porque este es multikey sobre el mismo
+# arreglo y con unique=True indexaría el producto system x value.
+registrar_indice(
+    COLLECTION_NAME,
+    [("identifier.system", ASCENDING), ("identifier.value", ASCENDING)],
+    name="identifier_system_value",
+)
+registrar_consulta(
+    COLLECTION_NAME,
+    "patient_by_identifier",
+    {"identifier": {"$elemMatch": {"system": "http://cedula", "value": "0"}}},
+)
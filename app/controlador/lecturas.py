@@ -0,0 +1,62 @@
+import base64
+import os
+
+import bson
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import Nearest, Primary, SecondaryPreferred
+
+# READ_PREFERENCE: "primary" (por defecto), "secondaryPreferred" o "nearest".
+# Solo aplica a las lecturas; las escrituras siempre van al primario.
+READ_PREFERENCE = os.getenv("READ_PREFERENCE", "primary")
+# Retraso máximo tolerado de un secundario (mínimo 90 s según MongoDB; -1 = sin límite)
+READ_MAX_STALENESS_SECONDS = int(os.getenv("READ_MAX_STALENESS_SECONDS", "90"))
+
+# Cabecera con la que se devuelve y se recibe el token de consistencia causal
+CONSISTENCY_HEADER = "X-Consistency-Token"
+
+_PREFERENCIAS = {
+    "secondarypreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+def preferencia_lectura():
+    clase = _PREFERENCIAS.get(READ_PREFERENCE.lower())
+    if clase is None:
+        return Primary()
+    return clase(max_staleness=READ_MAX_STALENESS_SECONDS)
+
+
+def coleccion_lecturas(collection):
+    """Vista de la colección que enruta las lecturas según READ_PREFERENCE."""
+    return collection.with_options(read_preference=preferencia_lectura())
+
+
+def coleccion_causal(collection):
+    """
+    Vista para lecturas causales: misma preferencia, pero con read concern
+    majority, que es lo que garantiza leer las propias escrituras en un
+    secundario dentro de una sesión causal.
+    """
+    return collection.with_options(read_preference=preferencia_lectura(), read_concern=ReadConcern("majority"))
+
+
+def token_consistencia(session):
+    """Serializa el clusterTime y operationTime de la sesión para el cliente."""
+    if session.cluster_time is None or session.operation_time is None:
+        return None
+    crudo = bson.encode({"c": session.cluster_time, "o": session.operation_time})
+    return base64.urlsafe_b64encode(crudo).decode()
+
+
+def aplicar_token(session, token):
+    """
+    Avanza la sesión hasta el token recibido: las lecturas siguientes esperan
+    en el secundario hasta haber replicado esa escritura.
+    """
+    try:
+        datos = bson.decode(base64.urlsafe_b64decode(token.encode()))
+    except Exception:
+        raise ValueError(f"{CONSISTENCY_HEADER} inválido")
+    session.advance_cluster_time(datos["c"])
+    session.advance_operation_time(datos["o"])
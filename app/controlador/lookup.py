@@ -0,0 +1,91 @@
+import os
+
+import orjson
+
+from app.controlador.cache import identifier_key
+from app.controlador.serializacion import dumps
+from app.controlador.tokens import PROYECCION_PUBLICA
+
+# Máximo de pares (system, value) por solicitud
+LOOKUP_MAX_PAIRS = int(os.getenv("LOOKUP_MAX_PAIRS", "1000"))
+# A partir de cuántos pares la respuesta se envía en streaming
+LOOKUP_STREAM_THRESHOLD = int(os.getenv("LOOKUP_STREAM_THRESHOLD", "100"))
+
+
+class IdentifierLookupError(ValueError):
+    """La lista de identificadores no es válida."""
+
+
+def leer_pares(body):
+    """
+    Acepta {"identifier": [{"system": ..., "value": ...}, ...]} y devuelve
+    un dict "system|value" -> (system, value) sin duplicados, en orden.
+    """
+    pares = body.get("identifier") if isinstance(body, dict) else None
+    if not isinstance(pares, list) or not pares:
+        raise IdentifierLookupError("Se esperaba 'identifier' como una lista de {system, value}")
+    if len(pares) > LOOKUP_MAX_PAIRS:
+        raise IdentifierLookupError(f"Máximo {LOOKUP_MAX_PAIRS} identificadores por solicitud")
+
+    vistos = {}
+    for par in pares:
+        if not isinstance(par, dict) or not par.get("system") or not par.get("value"):
+            raise IdentifierLookupError(f"Identificador inválido: {par!r}")
+        vistos.setdefault(identifier_key(par["system"], par["value"]), (par["system"], par["value"]))
+    return vistos
+
+
+def filtro_pares(pares):
+    # Un $elemMatch por par dentro de un $or: cada rama usa el índice
+    # identifier.system + identifier.value y todo se resuelve en una consulta.
+    return {"$or": [
+        {"identifier": {"$elemMatch": {"system": system, "value": value}}}
+        for system, value in pares
+    ]}
+
+
+def _claves_del_paciente(patient, pendientes):
+    for ident in patient.get("identifier", []):
+        if isinstance(ident, dict):
+            clave = identifier_key(ident.get("system"), ident.get("value"))
+            if clave in pendientes:
+                yield clave
+
+
+async def resolver(collection, cache, pares):
+    """
+    Resuelve los pares consultando primero la caché y luego, en una sola
+    consulta, los que falten. Produce tuplas (clave, paciente o None) a
+    medida que llegan del cursor; los no encontrados salen al final.
+    """
+    pendientes = {}
+    for clave, (system, value) in pares.items():
+        patient = cache.get_by_identifier(system, value)
+        if patient is not None:
+            yield clave, patient
+        else:
+            pendientes[clave] = (system, value)
+
+    if pendientes:
+        async for patient in collection.find(filtro_pares(pendientes.values()), PROYECCION_PUBLICA):
+            cache.put(patient)
+            for clave in list(_claves_del_paciente(patient, pendientes)):
+                del pendientes[clave]
+                yield clave, patient
+
+    for clave in pendientes:
+        yield clave, None
+
+
+async def resolver_dict(collection, cache, pares):
+    return {clave: patient async for clave, patient in resolver(collection, cache, pares)}
+
+
+async def resolver_stream(collection, cache, pares):
+    """Misma respuesta que resolver_dict, pero serializada por partes."""
+    yield b"{"
+    primero = True
+    async for clave, patient in resolver(collection, cache, pares):
+        yield (b"" if primero else b",") + orjson.dumps(clave) + b":" + dumps(patient)
+        primero = False
+    yield b"}"
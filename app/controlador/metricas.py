@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+from pymongo import monitoring
+from starlette.routing import Match
+
+from app.controlador.perfilado import registrar_fase
+
+# Con PROMETHEUS_MULTIPROC_DIR definido (lo hace gunicorn.conf.py) cada worker
+# escribe sus métricas en ese directorio y /metrics agrega las de todos.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+_BUCKETS_HTTP = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+_BUCKETS_MONGO = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+_BUCKETS_ADMISION = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5)
+_BUCKETS_VALIDACION = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Latencia de las solicitudes HTTP por ruta",
+    ["method", "route", "status"],
+    buckets=_BUCKETS_HTTP,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Solicitudes HTTP en curso por ruta",
+    ["method", "route"],
+    multiprocess_mode="livesum",
+)
+MONGO_COMMAND_LATENCY = Histogram(
+    "mongo_command_duration_seconds",
+    "Duración de los comandos de MongoDB",
+    ["command", "collection", "outcome"],
+    buckets=_BUCKETS_MONGO,
+)
+VALIDATION_LATENCY = Histogram(
+    "patient_validation_duration_seconds",
+    "Tiempo de Patient.model_validate + model_dump por recurso",
+    buckets=_BUCKETS_VALIDACION,
+)
+ADMISSION_QUEUE_WAIT = Histogram(
+    "admission_queue_wait_seconds",
+    "Espera en la cola de admisión antes de atender la solicitud",
+    ["budget"],
+    buckets=_BUCKETS_ADMISION,
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "admission_queue_depth",
+    "Solicitudes esperando en la cola de admisión",
+    ["budget"],
+    multiprocess_mode="livesum",
+)
+ADMISSION_SHED = Counter(
+    "admission_shed_total",
+    "Solicitudes rechazadas con 503 por control de admisión",
+    ["budget", "reason"],
+)
+WORKER_COLD_START = Gauge(
+    "worker_cold_start_seconds",
+    "Segundos desde el fork del worker hasta terminar el arranque",
+    multiprocess_mode="all",
+)
+
+
+def _plantilla_ruta(app, scope):
+    # Etiqueta por plantilla (/patient/id/{patient_id}) y no por path real,
+    # para no crear una serie por cada id.
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+def instalar_middleware(app):
+    @app.middleware("http")
+    async def medir_solicitud(request, call_next):
+        route = _plantilla_ruta(app, request.scope)
+        method = request.method
+        en_curso = REQUESTS_IN_FLIGHT.labels(method, route)
+        en_curso.inc()
+        inicio = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            REQUEST_LATENCY.labels(method, route, str(status)).observe(time.perf_counter() - inicio)
+            en_curso.dec()
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Histograma de duración de comandos de MongoDB por comando y colección."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._colecciones = {}
+
+    def started(self, event):
+        if event.command_name == "getMore":
+            # En getMore el valor del comando es el id del cursor
+            coleccion = event.command.get("collection")
+        else:
+            coleccion = event.command.get(event.command_name)
+        if not isinstance(coleccion, str):
+            coleccion = ""
+        with self._lock:
+            self._colecciones[(event.connection_id, event.request_id)] = coleccion
+
+    def _observar(self, event, outcome):
+        with self._lock:
+            coleccion = self._colecciones.pop((event.connection_id, event.request_id), "")
+        MONGO_COMMAND_LATENCY.labels(event.command_name, coleccion, outcome).observe(event.duration_micros / 1e6)
+        # Motor ejecuta el comando con el contexto de la solicitud, así que
+        # el tiempo se suma a la fase db si la solicitud se está perfilando
+        registrar_fase("db", event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self._observar(event, "success")
+
+    def failed(self, event):
+        self._observar(event, "failure")
+
+
+command_metrics = CommandMetricsListener()
+
+
+def generar_metricas():
+    """Devuelve (contenido, content_type) en formato de exposición de Prometheus."""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,337 @@
+"""
+Detección de pacientes duplicados (MPI) con claves de bloqueo.
+
+Al escribir, cada paciente recibe en `_mpi.keys` varias claves de bloqueo
+(código fonético del apellido, fecha de nacimiento, género). Dos pacientes
+solo se comparan si comparten alguna clave, lo que evita el O(n²) de
+comparar todos contra todos.
+
+- $match: puntúa un recurso contra los candidatos de sus bloques.
+- Proceso por lotes: recorre todos los bloques de la colección, puntúa los
+  pares en un pool de procesos y guarda los candidatos a duplicado.
+
+    MONGO_URI=... python -m app.controlador.mpi --procesos 8
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import re
+from difflib import SequenceMatcher
+
+from pymongo import ASCENDING, UpdateOne
+
+from app.controlador.db import COLLECTION_NAME
+from app.controlador.indices import registrar_indice
+from app.controlador.procesos import crear_pool
+from app.controlador.tokens import PROYECCION_PUBLICA, normalizar, palabras
+
+MPI_VERSION = 1
+# Máximo de candidatos leídos por bloque; un bloque mayor indica una clave
+# poco selectiva y se trunca para no disparar el costo cuadrático.
+MPI_MAX_BLOCK = int(os.getenv("MPI_MAX_BLOCK", "500"))
+# Umbrales del grado de coincidencia FHIR
+UMBRAL_CERTAIN = 0.95
+UMBRAL_PROBABLE = 0.80
+UMBRAL_POSSIBLE = 0.60
+
+# Campos necesarios para puntuar
+PROYECCION_MPI = {"identifier": 1, "name": 1, "birthDate": 1, "gender": 1, "telecom": 1, "_mpi": 1}
+
+# Reglas fonéticas para español, en orden: cada par (patrón, reemplazo)
+_REGLAS_FONETICAS = [
+    (re.compile(r"ch"), "x"),
+    (re.compile(r"ll"), "y"),
+    (re.compile(r"qu(?=[ei])"), "k"),
+    (re.compile(r"g(?=[ei])"), "j"),
+    (re.compile(r"gu(?=[ei])"), "g"),
+    (re.compile(r"c(?=[ei])"), "s"),
+    (re.compile(r"c"), "k"),
+    (re.compile(r"q"), "k"),
+    (re.compile(r"z"), "s"),
+    (re.compile(r"v"), "b"),
+    (re.compile(r"w"), "u"),
+    (re.compile(r"h"), ""),
+    (re.compile(r"y(?![aeiou])"), "i"),
+    (re.compile(r"(.)\1+"), r"\1"),
+]
+
+
+def fonetico(texto):
+    """
+    Código fonético aproximado para apellidos en español: 'Gómez' y 'Gomes'
+    comparten código, igual que 'Vásquez' y 'Basques' o 'Rodríguez' y 'Rodrigues'.
+    """
+    codigo = re.sub(r"[^a-z]", "", normalizar(texto or ""))
+    for patron, reemplazo in _REGLAS_FONETICAS:
+        codigo = patron.sub(reemplazo, codigo)
+    return codigo
+
+
+def _apellidos(data):
+    apellidos = set()
+    for nombre in data.get("name", []):
+        if isinstance(nombre, dict):
+            apellidos.update(palabras(nombre.get("family")))
+    return apellidos
+
+
+def calcular_claves(data):
+    """Claves de bloqueo del paciente."""
+    # birthDate es texto en lo guardado (mode="json"); str() cubre un date suelto
+    fecha = str(data.get("birthDate") or "")
+    genero = data.get("gender") or ""
+    claves = set()
+    for apellido in _apellidos(data):
+        codigo = fonetico(apellido)
+        if not codigo:
+            continue
+        if fecha:
+            claves.add(f"fb:{codigo}|{fecha}")
+        if genero and fecha[:4]:
+            claves.add(f"fga:{codigo}|{genero}|{fecha[:4]}")
+    # Fecha + género cubre errores graves en el apellido
+    if fecha and genero:
+        claves.add(f"bg:{fecha}|{genero}")
+    for ident in data.get("identifier", []):
+        if isinstance(ident, dict) and ident.get("value"):
+            claves.add(f"id:{ident['value']}")
+    return sorted(claves)
+
+
+def agregar_claves(data):
+    data["_mpi"] = {"v": MPI_VERSION, "keys": calcular_claves(data)}
+    return data
+
+
+# --- Puntuación ---
+
+def _nombres(data):
+    family, given = set(), set()
+    for nombre in data.get("name", []):
+        if isinstance(nombre, dict):
+            family.update(palabras(nombre.get("family")))
+            for g in nombre.get("given", []):
+                given.update(palabras(g))
+    return family, given
+
+
+def _similitud(a, b):
+    if not a or not b:
+        return 0.0
+    return max(SequenceMatcher(None, x, y).ratio() for x in a for y in b)
+
+
+def _conjunto(data, campo, claves):
+    return {
+        tuple(normalizar(str(item.get(c, ""))) for c in claves)
+        for item in data.get(campo, []) if isinstance(item, dict) and item.get("value")
+    }
+
+
+def puntuar(a, b):
+    """Puntaje de 0 a 1 de que `a` y `b` sean el mismo paciente."""
+    ids_a = _conjunto(a, "identifier", ("system", "value"))
+    ids_b = _conjunto(b, "identifier", ("system", "value"))
+    if ids_a & ids_b:
+        return 1.0
+
+    family_a, given_a = _nombres(a)
+    family_b, given_b = _nombres(b)
+    puntaje = 0.35 * _similitud(family_a, family_b) + 0.20 * _similitud(given_a, given_b)
+
+    fecha_a, fecha_b = a.get("birthDate") or "", b.get("birthDate") or ""
+    if fecha_a and fecha_a == fecha_b:
+        puntaje += 0.30
+    elif fecha_a[:4] and fecha_a[:4] == fecha_b[:4]:
+        puntaje += 0.10
+
+    if a.get("gender") and a.get("gender") == b.get("gender"):
+        puntaje += 0.05
+    if _conjunto(a, "telecom", ("value",)) & _conjunto(b, "telecom", ("value",)):
+        puntaje += 0.10
+    return round(min(puntaje, 1.0), 4)
+
+
+def grado(puntaje):
+    if puntaje >= UMBRAL_CERTAIN:
+        return "certain"
+    if puntaje >= UMBRAL_PROBABLE:
+        return "probable"
+    if puntaje >= UMBRAL_POSSIBLE:
+        return "possible"
+    return None
+
+
+# --- $match sobre un recurso ---
+
+async def buscar_coincidencias(collection, recurso, count=10, only_certain=False):
+    """Devuelve [(documento, puntaje)] ordenado de mayor a menor puntaje."""
+    claves = calcular_claves(recurso)
+    if not claves:
+        return []
+    candidatos = collection.find({"_mpi.keys": {"$in": claves}}, PROYECCION_PUBLICA).limit(MPI_MAX_BLOCK)
+    resultados = []
+    async for doc in candidatos:
+        puntaje = puntuar(recurso, doc)
+        g = grado(puntaje)
+        if g is None or (only_certain and g != "certain"):
+            continue
+        resultados.append((doc, puntaje))
+    resultados.sort(key=lambda r: r[1], reverse=True)
+    return resultados[:count]
+
+
+def leer_parametros_match(parametros):
+    """
+    Lee el recurso Parameters de $match: devuelve (resource, count, onlyCertainMatches).
+    """
+    if not isinstance(parametros, dict) or parametros.get("resourceType") != "Parameters":
+        raise ValueError("Se esperaba un recurso Parameters")
+    recurso, count, only_certain = None, 10, False
+    for p in parametros.get("parameter", []):
+        if p.get("name") == "resource":
+            recurso = p.get("resource")
+        elif p.get("name") == "count":
+            count = int(p.get("valueInteger", count))
+        elif p.get("name") == "onlyCertainMatches":
+            only_certain = bool(p.get("valueBoolean", False))
+    if recurso is None:
+        raise ValueError("Falta el parámetro 'resource'")
+    return recurso, count, only_certain
+
+
+def bundle_coincidencias(resultados):
+    return {
+        "resourceType": "Bundle",
+        "type": "searchset",
+        "total": len(resultados),
+        "entry": [
+            {
+                "fullUrl": f"Patient/{doc['_id']}",
+                "resource": doc,
+                "search": {
+                    "mode": "match",
+                    "score": puntaje,
+                    "extension": [{
+                        "url": "http://hl7.org/fhir/StructureDefinition/match-grade",
+                        "valueCode": grado(puntaje),
+                    }],
+                },
+            }
+            for doc, puntaje in resultados
+        ],
+    }
+
+
+# --- Proceso por lotes ---
+
+def puntuar_bloque(bloque):
+    """Corre en un proceso hijo: puntúa todos los pares de un bloque."""
+    clave, docs = bloque
+    pares = []
+    for a, b in itertools.combinations(docs, 2):
+        puntaje = puntuar(a, b)
+        if puntaje >= UMBRAL_POSSIBLE:
+            ida, idb = sorted((str(a["_id"]), str(b["_id"])))
+            pares.append((ida, idb, puntaje, clave))
+    return pares
+
+
+async def rellenar_claves(collection, lote=1000):
+    """Calcula `_mpi` para los pacientes sin claves o con una versión anterior."""
+    operaciones = []
+    async for doc in collection.find({"resourceType": "Patient", "_mpi.v": {"$ne": MPI_VERSION}}, PROYECCION_MPI):
+        operaciones.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"_mpi": agregar_claves(doc)["_mpi"]}}))
+        if len(operaciones) >= lote:
+            await collection.bulk_write(operaciones, ordered=False)
+            operaciones = []
+    if operaciones:
+        await collection.bulk_write(operaciones, ordered=False)
+
+
+async def bloques(collection):
+    """Agrupa los pacientes por clave de bloqueo; solo bloques con 2 o más."""
+    pipeline = [
+        {"$match": {"_mpi.keys": {"$exists": True}}},
+        {"$project": PROYECCION_MPI},
+        {"$unwind": "$_mpi.keys"},
+        # $firstN (MongoDB 5.2+) acota el bloque dentro del $group: con $push se
+        # juntaba el bloque completo en memoria antes de recortarlo
+        {"$group": {
+            "_id": "$_mpi.keys",
+            "docs": {"$firstN": {"input": "$$ROOT", "n": MPI_MAX_BLOCK}},
+            "n": {"$sum": 1},
+        }},
+        {"$match": {"n": {"$gt": 1}}},
+        {"$project": {"docs": 1}},
+    ]
+    async for bloque in collection.aggregate(pipeline, allowDiskUse=True):
+        yield bloque["_id"], bloque["docs"]
+
+
+async def detectar_duplicados(collection, destino, procesos=None, en_vuelo=None):
+    """
+    Recorre todos los bloques, los puntúa en paralelo y guarda los pares
+    candidatos en `destino` (un par por _id "a|b", sin repetir).
+    """
+    procesos = procesos or os.cpu_count() or 1
+    en_vuelo = en_vuelo or procesos * 4
+    loop = asyncio.get_running_loop()
+    total = 0
+
+    async def guardar(pares):
+        nonlocal total
+        if not pares:
+            return
+        await destino.bulk_write([
+            UpdateOne(
+                {"_id": f"{a}|{b}"},
+                {"$max": {"score": puntaje}, "$set": {"a": a, "b": b}, "$addToSet": {"keys": clave}},
+                upsert=True,
+            )
+            for a, b, puntaje, clave in pares
+        ], ordered=False)
+        total += len(pares)
+
+    with crear_pool(procesos, precarga=("app.controlador.mpi",)) as pool:
+        pendientes = set()
+        async for bloque in bloques(collection):
+            pendientes.add(loop.run_in_executor(pool, puntuar_bloque, bloque))
+            # Limita los bloques en vuelo para que la memoria no crezca con la colección
+            if len(pendientes) >= en_vuelo:
+                hechos, pendientes = await asyncio.wait(pendientes, return_when=asyncio.FIRST_COMPLETED)
+                for hecho in hechos:
+                    await guardar(hecho.result())
+        for hecho in asyncio.as_completed(pendientes):
+            await guardar(await hecho)
+    return total
+
+
+registrar_indice(COLLECTION_NAME, [("_mpi.keys", ASCENDING)], name="mpi_keys")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--destino", default="solicitud_duplicados")
+    args = parser.parse_args()
+
+    from app.controlador.db import COLLECTION_NAME, DB_NAME, crear_cliente
+
+    async def ejecutar():
+        client = crear_cliente()
+        try:
+            db = client[DB_NAME]
+            collection = db[COLLECTION_NAME]
+            await rellenar_claves(collection)
+            total = await detectar_duplicados(collection, db[args.destino], args.procesos)
+            print(f"Pares candidatos escritos: {total}")
+        finally:
+            client.close()
+
+    asyncio.run(ejecutar())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Perfilado opcional por solicitud.
+
+Una solicitud se perfila si trae la cabecera `X-Profile` con el token de
+PROFILE_TOKEN, o al azar con probabilidad PROFILE_SAMPLE_RATE. Mientras
+dura, un hilo toma muestras de la pila del hilo del event loop cada
+PROFILE_INTERVAL_MS y al terminar se escriben en PROFILE_DIR:
+
+- `<id>.speedscope.json`: se abre en https://www.speedscope.app
+- `<id>.folded`: pilas colapsadas para flamegraph.pl o inferno
+
+Además se mide el tiempo por fase (validate, db, serialize) con un
+acumulador en un ContextVar; las fases se devuelven en la cabecera
+Server-Timing y en el nombre del perfil. El tiempo del event loop en espera
+de red aparece en la pila como el select del loop.
+
+Con código Python ocupando el GIL, el muestreo efectivo queda limitado por
+sys.getswitchinterval() (5 ms por defecto) aunque el intervalo sea menor.
+Las muestras son del hilo completo: si otras solicitudes corren a la vez en
+el mismo worker, también aparecen en el perfil. Solo se perfila una
+solicitud a la vez por worker.
+
+Con PROFILE_TOKEN vacío y PROFILE_SAMPLE_RATE=0 el middleware no se instala
+y las fases solo cuestan leer un ContextVar vacío.
+"""
+import asyncio
+import contextvars
+import hmac
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import orjson
+
+# Token de la cabecera X-Profile; vacío = la cabecera no activa el perfilado
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+# Fracción de solicitudes perfiladas al azar (0 = ninguna)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Intervalo de muestreo de la pila
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+# Máximo de muestras por perfil (acota la memoria en solicitudes largas)
+PROFILE_MAX_SAMPLES = int(os.getenv("PROFILE_MAX_SAMPLES", "20000"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/crear-solicitud-profiles")
+
+PROFILE_HEADER = "x-profile"
+
+# Acumulador {fase: segundos} de la solicitud perfilada en curso
+_fases = contextvars.ContextVar("fases_perfilado", default=None)
+_secuencia = itertools.count()
+_ocupado = threading.Lock()
+
+
+# --- Fases ---
+
+def registrar_fase(nombre, segundos):
+    """Suma tiempo a una fase; no hace nada fuera de una solicitud perfilada."""
+    fases = _fases.get()
+    if fases is not None:
+        fases[nombre] = fases.get(nombre, 0.0) + segundos
+
+
+@contextmanager
+def fase(nombre):
+    if _fases.get() is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar_fase(nombre, time.perf_counter() - inicio)
+
+
+def server_timing(fases, total):
+    partes = [f"{nombre};dur={segundos * 1000:.2f}" for nombre, segundos in sorted(fases.items())]
+    partes.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(partes)
+
+
+# --- Muestreo ---
+
+class Muestreador(threading.Thread):
+    """Toma muestras de la pila de otro hilo a intervalo fijo."""
+
+    def __init__(self, hilo_id, intervalo_ms=PROFILE_INTERVAL_MS, max_muestras=PROFILE_MAX_SAMPLES):
+        super().__init__(daemon=True, name="perfilado")
+        self.hilo_id = hilo_id
+        self.intervalo = intervalo_ms / 1000
+        self.max_muestras = max_muestras
+        self.muestras = []   # (instante, (marco raíz, ..., marco hoja))
+        self._parar = threading.Event()
+
+    def run(self):
+        propio = threading.get_ident()
+        while not self._parar.wait(self.intervalo) and len(self.muestras) < self.max_muestras:
+            frame = sys._current_frames().get(self.hilo_id)
+            if frame is None or self.hilo_id == propio:
+                continue
+            pila = []
+            while frame is not None:
+                codigo = frame.f_code
+                pila.append((codigo.co_name, codigo.co_filename, codigo.co_firstlineno))
+                frame = frame.f_back
+            self.muestras.append((time.perf_counter(), tuple(reversed(pila))))
+
+    def detener(self):
+        self._parar.set()
+        self.join()
+
+
+def speedscope(muestras, nombre, inicio, fin):
+    """Perfil en el formato de archivo de speedscope (tipo sampled)."""
+    indices, frames = {}, []
+    pilas, pesos = [], []
+    anterior = inicio
+    for instante, pila in muestras:
+        fila = []
+        for marco in pila:
+            if marco not in indices:
+                indices[marco] = len(frames)
+                frames.append({"name": marco[0], "file": marco[1], "line": marco[2]})
+            fila.append(indices[marco])
+        pilas.append(fila)
+        pesos.append(instante - anterior)
+        anterior = instante
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": nombre,
+        "exporter": "crear-solicitud",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": nombre,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": fin - inicio,
+            "samples": pilas,
+            "weights": pesos,
+        }],
+    }
+
+
+def colapsadas(muestras):
+    """Pilas colapsadas ('a;b;c N'), la entrada de flamegraph.pl."""
+    conteo = {}
+    for _, pila in muestras:
+        clave = ";".join(f"{nombre} ({os.path.basename(archivo)}:{linea})" for nombre, archivo, linea in pila)
+        conteo[clave] = conteo.get(clave, 0) + 1
+    return "".join(f"{pila} {n}\n" for pila, n in conteo.items())
+
+
+def guardar(perfil_id, muestras, nombre, inicio, fin):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, perfil_id)
+    with open(base + ".speedscope.json", "wb") as f:
+        f.write(orjson.dumps(speedscope(muestras, nombre, inicio, fin)))
+    with open(base + ".folded", "w") as f:
+        f.write(colapsadas(muestras))
+    return base
+
+
+# --- Middleware ---
+
+def debe_perfilar(request):
+    token = request.headers.get(PROFILE_HEADER)
+    # Se comparan bytes: con str, compare_digest lanza TypeError si no es ASCII.
+    # Las cabeceras llegan decodificadas como latin-1; así se recuperan los bytes.
+    if token is not None and PROFILE_TOKEN and hmac.compare_digest(token.encode("latin-1"), PROFILE_TOKEN.encode()):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def instalar_perfilado(app):
+    """Instala el middleware solo si el perfilado está habilitado."""
+    if not PROFILE_TOKEN and PROFILE_SAMPLE_RATE <= 0:
+        return
+
+    @app.middleware("http")
+    async def perfilar(request, call_next):
+        if not debe_perfilar(request) or not _ocupado.acquire(blocking=False):
+            return await call_next(request)
+        fases = {}
+        marca = _fases.set(fases)
+        muestreador = Muestreador(threading.get_ident())
+        inicio = time.perf_counter()
+        muestreador.start()
+        try:
+            response = await call_next(request)
+        finally:
+            fin = time.perf_counter()
+            muestreador.detener()
+            _fases.reset(marca)
+            _ocupado.release()
+
+        perfil_id = f"{int(time.time())}-{os.getpid()}-{next(_secuencia)}"
+        detalle = " ".join(f"{n}={s * 1000:.1f}ms" for n, s in sorted(fases.items()))
+        nombre = f"{request.method} {request.url.path} {detalle}".strip()
+        # Serializar y escribir el perfil no bloquea el event loop
+        await asyncio.to_thread(guardar, perfil_id, muestreador.muestras, nombre, inicio, fin)
+        response.headers["Server-Timing"] = server_timing(fases, fin - inicio)
+        response.headers["X-Profile-Id"] = perfil_id
+        return response
@@ -0,0 +1,25 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Número de workers de gunicorn (lo exporta gunicorn.conf.py); los pools de
+# procesos de cada worker se reparten los núcleos entre todos ellos
+GUNICORN_WORKERS = int(os.getenv("GUNICORN_WORKERS", "1"))
+
+
+def procesos_por_worker():
+    return max(1, (os.cpu_count() or 1) // max(1, GUNICORN_WORKERS))
+
+
+def crear_pool(max_workers, precarga=("app.controlador.validacion",)):
+    """
+    ProcessPoolExecutor con forkserver en lugar de fork.
+
+    Los pools se crean dentro de procesos que ya tienen hilos (Motor, los
+    listeners de pymongo); hacer fork ahí puede dejar un lock tomado en el
+    hijo. El servidor de forkserver arranca limpio, importa `precarga` una
+    sola vez y los hijos se bifurcan desde él.
+    """
+    contexto = multiprocessing.get_context("forkserver")
+    contexto.set_forkserver_preload(list(precarga))
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=contexto)
@@ -0,0 +1,35 @@
+import orjson
+from bson import ObjectId
+from fastapi.responses import Response
+
+from app.controlador.perfilado import fase
+
+
+def _default(valor):
+    # orjson llama a esta función solo para los tipos que no conoce;
+    # en los documentos de pacientes eso es únicamente el ObjectId.
+    if isinstance(valor, ObjectId):
+        return str(valor)
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+
+def dumps(documento):
+    """Serializa un documento de MongoDB a JSON (bytes), con _id como string."""
+    return orjson.dumps(documento, default=_default)
+
+
+class FHIRJSONResponse(Response):
+    """
+    Respuesta JSON que serializa el documento directamente con orjson.
+
+    Al devolver una instancia de Response, FastAPI no pasa el contenido por
+    jsonable_encoder: el documento leído de MongoDB se recorre una sola vez.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content):
+        if isinstance(content, (bytes, bytearray)):
+            return bytes(content)
+        with fase("serialize"):
+            return dumps(content)
@@ -0,0 +1,46 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Coalescencia de consultas concurrentes idénticas dentro de un worker.
+
+    Mientras una consulta para `clave` está en vuelo, las demás solicitudes
+    con la misma clave esperan ese mismo resultado en lugar de lanzar su
+    propia consulta a MongoDB. Al terminar, la clave se libera: no es una
+    caché, solo agrupa las solicitudes simultáneas.
+    """
+
+    def __init__(self):
+        self._en_vuelo = {}
+        self.calls = 0
+        self.executions = 0
+
+    @property
+    def coalesced(self):
+        return self.calls - self.executions
+
+    async def do(self, clave, funcion):
+        """Ejecuta `funcion()` (una corrutina) una sola vez por clave en vuelo."""
+        self.calls += 1
+        tarea = self._en_vuelo.get(clave)
+        if tarea is None:
+            self.executions += 1
+            tarea = asyncio.ensure_future(funcion())
+            self._en_vuelo[clave] = tarea
+            tarea.add_done_callback(lambda _: self._en_vuelo.pop(clave, None))
+        # shield: si un cliente cancela su solicitud, la consulta compartida
+        # sigue en curso para los demás que la están esperando.
+        return await asyncio.shield(tarea)
+
+    def stats(self):
+        return {
+            "in_flight": len(self._en_vuelo),
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "coalescing_ratio": round(self.coalesced / self.calls, 4) if self.calls else 0.0,
+        }
+
+
+patient_flight = SingleFlight()
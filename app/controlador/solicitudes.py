@@ -0,0 +1,235 @@
+"""
+Recursos ServiceRequest (la "solicitud" que da nombre al servicio).
+
+Cada ServiceRequest referencia en `subject` a un Patient de la colección de
+pacientes. Al escribir se guarda además `_subject` con el ObjectId del
+paciente: es la clave de la unión en Patient/{id}/$everything, que trae el
+paciente y sus solicitudes en una sola agregación con $lookup, y del índice
+(_subject, authoredOn) que mantiene rápido el historial de cada paciente.
+"""
+import asyncio
+import re
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fhir.resources.servicerequest import ServiceRequest
+from pymongo import ASCENDING, DESCENDING
+
+from app.controlador import busqueda
+from app.controlador.busqueda import SearchParameterError
+from app.controlador.db import SERVICE_REQUEST_COLLECTION
+from app.controlador.indices import registrar_consulta, registrar_indice
+from app.controlador.perfilado import fase
+from app.controlador.tokens import PROYECCION_PUBLICA
+from app.controlador.validacion import get_pool
+from app.controlador.versiones import asignar_meta
+
+# Máximo de solicitudes devueltas por $everything
+EVERYTHING_MAX_REQUESTS = 1000
+
+# El campo de unión no forma parte del recurso FHIR
+PROYECCION_SOLICITUD = {"_subject": 0}
+# Historial del paciente: más recientes primero
+ORDEN_HISTORIAL = [("authoredOn", DESCENDING), ("_id", DESCENDING)]
+
+_REFERENCIA_PACIENTE = re.compile(r"^(?:.*/)?Patient/([0-9a-fA-F]{24})$")
+
+
+class ServiceRequestValidationError(ValueError):
+    """El recurso no es un ServiceRequest FHIR válido o su subject no es un paciente."""
+
+
+def paciente_de_referencia(referencia):
+    """ObjectId del paciente en 'Patient/{id}' (o solo '{id}'), o None."""
+    if not isinstance(referencia, str):
+        return None
+    encontrado = _REFERENCIA_PACIENTE.match(referencia)
+    texto = encontrado.group(1) if encontrado else referencia
+    try:
+        return ObjectId(texto)
+    except (InvalidId, TypeError):
+        return None
+
+
+def _validar_completo(data):
+    # Corre en el pool de validación; el error vuelve como texto (ver validacion._validar_lote)
+    try:
+        return True, ServiceRequest.model_validate(data).model_dump(mode="json", by_alias=True, exclude_unset=True)
+    except Exception as e:
+        return False, str(e)
+
+
+async def validar_solicitud(data):
+    """
+    Valida el ServiceRequest y devuelve el documento a guardar, con meta,
+    authoredOn (si no venía, el momento de creación) y `_subject`.
+    """
+    if not isinstance(data, dict) or data.get("resourceType") != "ServiceRequest":
+        raise ServiceRequestValidationError("Se esperaba un recurso ServiceRequest")
+    subject = data.get("subject")
+    if not isinstance(subject, dict):
+        raise ServiceRequestValidationError("subject debe ser un objeto Reference")
+    patient_id = paciente_de_referencia(subject.get("reference"))
+    if patient_id is None:
+        raise ServiceRequestValidationError("subject.reference debe ser 'Patient/{id}'")
+
+    pool = get_pool()
+    with fase("validate"):
+        if pool is None:
+            ok, valor = _validar_completo(data)
+        else:
+            ok, valor = await asyncio.get_running_loop().run_in_executor(pool, _validar_completo, data)
+    if not ok:
+        raise ServiceRequestValidationError(valor)
+
+    valor["authoredOn"] = normalizar_authored(valor.get("authoredOn") or datetime.now(timezone.utc))
+    valor["subject"]["reference"] = f"Patient/{patient_id}"
+    valor["_subject"] = patient_id
+    return asignar_meta(valor)
+
+
+def normalizar_authored(valor):
+    """
+    authoredOn se guarda siempre como texto en UTC ("2024-01-02T10:00:00Z"):
+    el filtro authored, el orden del historial y el cursor `_after` comparan
+    cadenas, así que todas deben tener la misma forma. Las fechas parciales
+    ("2024-01") se guardan tal cual.
+    """
+    if isinstance(valor, str):
+        if "T" not in valor:
+            return valor
+        try:
+            valor = datetime.fromisoformat(valor.replace("Z", "+00:00"))
+        except ValueError:
+            return valor
+    if valor.tzinfo is None:
+        valor = valor.replace(tzinfo=timezone.utc)
+    return valor.astimezone(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+
+
+async def crear_solicitud(pacientes, solicitudes, data):
+    """Guarda el ServiceRequest si su paciente existe; devuelve el _id."""
+    documento = await validar_solicitud(data)
+    if await pacientes.find_one({"_id": documento["_subject"]}, {"_id": 1}) is None:
+        raise ServiceRequestValidationError(f"El paciente {documento['_subject']} no existe")
+    result = await solicitudes.insert_one(documento)
+    return result.inserted_id
+
+
+# --- Búsqueda ---
+
+def construir_filtro(params):
+    """Parámetros FHIR de ServiceRequest: subject/patient, status, intent y authored."""
+    condiciones = []
+    for valor in params.getlist("subject") + params.getlist("patient"):
+        patient_id = paciente_de_referencia(valor)
+        if patient_id is None:
+            raise SearchParameterError(f"subject inválido: {valor!r}")
+        condiciones.append({"_subject": patient_id})
+    for campo in ("status", "intent"):
+        for valor in params.getlist(campo):
+            condiciones.append({campo: valor})
+    fechas = params.getlist("authored")
+    if fechas:
+        condiciones.append(busqueda.filtro_fecha("authoredOn", fechas, "authored", busqueda.FECHA_HORA))
+
+    if not condiciones:
+        return {}
+    return condiciones[0] if len(condiciones) == 1 else {"$and": condiciones}
+
+
+def leer_cursor(params):
+    """
+    `_after` es "authoredOn|_id" del último resultado: la paginación es por
+    clave sobre el mismo orden del índice (authoredOn, _id) descendente.
+    """
+    after = params.get("_after")
+    if after is None:
+        return None
+    authored, _, texto = after.rpartition("|")
+    try:
+        return {"$or": [
+            {"authoredOn": {"$lt": authored}},
+            {"authoredOn": authored, "_id": {"$lt": ObjectId(texto)}},
+        ]}
+    except (InvalidId, TypeError):
+        raise SearchParameterError(f"_after inválido: {after!r}")
+
+
+async def buscar_solicitudes(collection, params):
+    """Devuelve (documentos, hay_mas), más recientes primero."""
+    filtro = construir_filtro(params)
+    count = busqueda.leer_count(params)
+    after = leer_cursor(params)
+    if after is not None:
+        filtro = {"$and": [filtro, after]} if filtro else after
+
+    cursor = collection.find(filtro, PROYECCION_SOLICITUD).sort(ORDEN_HISTORIAL).limit(count + 1)
+    documentos = await cursor.to_list(length=count + 1)
+    return documentos[:count], len(documentos) > count
+
+
+def cursor_solicitud(doc):
+    """Valor de `_after` para continuar después de `doc` (ver leer_cursor)."""
+    return f"{doc['authoredOn']}|{doc['_id']}"
+
+
+def construir_bundle(documentos, hay_mas, url):
+    return busqueda.construir_bundle(documentos, hay_mas, url, tipo="ServiceRequest", cursor=cursor_solicitud)
+
+
+# --- Patient/{id}/$everything ---
+
+async def paciente_con_solicitudes(pacientes, patient_id, limite=EVERYTHING_MAX_REQUESTS):
+    """
+    Paciente y sus ServiceRequest en un solo viaje a MongoDB ($lookup sobre
+    el índice (_subject, authoredOn)). Devuelve None si el paciente no existe.
+    """
+    pipeline = [
+        {"$match": {"_id": patient_id}},
+        {"$project": PROYECCION_PUBLICA},
+        {"$lookup": {
+            "from": SERVICE_REQUEST_COLLECTION,
+            "localField": "_id",
+            "foreignField": "_subject",
+            "pipeline": [
+                {"$sort": dict(ORDEN_HISTORIAL)},
+                {"$limit": limite},
+                {"$project": PROYECCION_SOLICITUD},
+            ],
+            "as": "_solicitudes",
+        }},
+    ]
+    resultado = await pacientes.aggregate(pipeline).to_list(length=1)
+    return resultado[0] if resultado else None
+
+
+def bundle_everything(paciente):
+    solicitudes = paciente.pop("_solicitudes", [])
+    return {
+        "resourceType": "Bundle",
+        "type": "searchset",
+        "total": 1 + len(solicitudes),
+        "entry": [{"fullUrl": f"Patient/{paciente['_id']}", "resource": paciente, "search": {"mode": "match"}}] + [
+            {"fullUrl": f"ServiceRequest/{doc['_id']}", "resource": doc, "search": {"mode": "include"}}
+            for doc in solicitudes
+        ],
+    }
+
+
+# --- Índices ---
+registrar_indice(
+    SERVICE_REQUEST_COLLECTION,
+    [("_subject", ASCENDING), ("authoredOn", DESCENDING), ("_id", DESCENDING)],
+    name="subject_authored_id",
+)
+registrar_indice(
+    SERVICE_REQUEST_COLLECTION,
+    [("authoredOn", DESCENDING), ("_id", DESCENDING)],
+    name="authored_id",
+)
+registrar_consulta(SERVICE_REQUEST_COLLECTION, "requests_by_subject", {"_subject": ObjectId()}, sort=ORDEN_HISTORIAL)
+registrar_consulta(
+    SERVICE_REQUEST_COLLECTION, "requests_by_authored", {"authoredOn": {"$gte": "2024-01-01"}}, sort=ORDEN_HISTORIAL
+)
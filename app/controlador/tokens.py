@@ -0,0 +1,197 @@
+"""
+Tokens de búsqueda de nombres calculados al escribir.
+
+Los nombres se guardan normalizados (sin tildes, en minúsculas) en el campo
+`_search` junto al recurso FHIR, para que la búsqueda por nombre sea un
+prefijo anclado sobre un índice multikey: "gom" encuentra "Gómez" sin regex
+insensible a mayúsculas ni recorrido de la colección.
+
+`_search.identifier` guarda además cada identificador como "system|value":
+un solo campo con índice único, que es lo que hace atómica la creación
+condicional (ver condicional.py).
+
+Relleno de documentos existentes:
+    MONGO_URI=... python -m app.controlador.tokens --lote 1000
+"""
+import argparse
+import asyncio
+import re
+import unicodedata
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.controlador.db import COLLECTION_NAME
+from app.controlador.indices import IDENTIFIER_UNIQUE, registrar_consulta, registrar_indice, registrar_indice_obsoleto
+
+# Versión del cálculo de tokens; el relleno recalcula las versiones antiguas
+SEARCH_VERSION = 2
+# Proyección para las lecturas públicas: los campos calculados al escribir
+# (tokens de búsqueda y claves MPI) no forman parte del recurso FHIR
+PROYECCION_PUBLICA = {"_search": 0, "_mpi": 0}
+
+_SEPARADORES = re.compile(r"[^0-9a-z]+")
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes: 'Gómez' -> 'gomez', 'Muñoz' -> 'munoz'."""
+    descompuesto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def palabras(texto):
+    if not isinstance(texto, str):
+        return []
+    return [p for p in _SEPARADORES.split(normalizar(texto)) if p]
+
+
+def clave_identificador(system, value):
+    return f"{system}|{value}"
+
+
+def claves_identificador(data):
+    """Claves "system|value" de los identificadores con ambos campos."""
+    claves = set()
+    for ident in data.get("identifier") or []:
+        if isinstance(ident, dict) and ident.get("system") and ident.get("value"):
+            claves.add(clave_identificador(ident["system"], ident["value"]))
+    return sorted(claves)
+
+
+def calcular_tokens(data):
+    family, given, todos = set(), set(), set()
+    for nombre in data.get("name", []):
+        if not isinstance(nombre, dict):
+            continue
+        family.update(palabras(nombre.get("family")))
+        for g in nombre.get("given", []):
+            given.update(palabras(g))
+        todos.update(palabras(nombre.get("text")))
+    todos |= family | given
+    tokens = {
+        "v": SEARCH_VERSION,
+        "family": sorted(family),
+        "given": sorted(given),
+        "name": sorted(todos),
+    }
+    # Sin identificadores el campo se omite: el índice único es parcial
+    identificadores = claves_identificador(data)
+    if identificadores:
+        tokens["identifier"] = identificadores
+    return tokens
+
+
+def agregar_tokens(data):
+    """Añade `_search` al documento que se va a guardar y lo devuelve."""
+    data["_search"] = calcular_tokens(data)
+    return data
+
+
+def filtro_prefijo(campo, valor):
+    """
+    Filtro de prefijo sobre los tokens. Cada palabra del valor debe ser
+    prefijo de algún token ('mar dua' encuentra 'Mario Duarte').
+    """
+    condiciones = [{f"_search.{campo}": {"$regex": "^" + re.escape(p)}} for p in palabras(valor)]
+    if not condiciones:
+        return {f"_search.{campo}": {"$exists": True}}
+    return condiciones[0] if len(condiciones) == 1 else {"$and": condiciones}
+
+
+# --- Índices ---
+for _campo in ("name", "family", "given"):
+    registrar_indice(COLLECTION_NAME, [(f"_search.{_campo}", ASCENDING), ("_id", ASCENDING)], name=f"search_tokens_{_campo}_id")
+registrar_consulta(COLLECTION_NAME, "search_name_tokens", filtro_prefijo("name", "gom"), sort=[("_id", ASCENDING)])
+registrar_consulta(COLLECTION_NAME, "search_family_tokens", filtro_prefijo("family", "dua"), sort=[("_id", ASCENDING)])
+registrar_consulta(COLLECTION_NAME, "search_given_tokens", filtro_prefijo("given", "mar"), sort=[("_id", ASCENDING)])
+# Los índices de regex sobre name.* que estos tokens reemplazaron
+for _campo in ("family", "given", "text"):
+    registrar_indice_obsoleto(COLLECTION_NAME, f"search_name.{_campo}_id")
+# A diferencia del índice compuesto sobre identifier.system/identifier.value,
+# que con unique=True indexa el producto system x value del documento, aquí
+# cada clave es un par real y la unicidad es exacta.
+registrar_indice(
+    COLLECTION_NAME,
+    [("_search.identifier", ASCENDING)],
+    name="search_identifier_unique",
+    unique=IDENTIFIER_UNIQUE,
+    partialFilterExpression={"_search.identifier": {"$exists": True}},
+)
+registrar_consulta(
+    COLLECTION_NAME, "patient_by_identifier_key", {"_search.identifier": {"$elemMatch": {"$eq": "http://cedula|0"}}}
+)
+
+
+# --- Relleno de documentos existentes ---
+
+async def _escribir_lote(collection, operaciones, tokens):
+    """
+    bulk_write del lote. Los documentos cuyo identificador ya tiene otro
+    paciente (11000 en el índice único) se reescriben sin
+    `_search.identifier`: conservan los tokens de nombre y quedan al día,
+    así que una nueva corrida no vuelve a detenerse en ellos.
+    Devuelve los _id duplicados.
+    """
+    try:
+        await collection.bulk_write(operaciones, ordered=False)
+        return []
+    except BulkWriteError as e:
+        duplicados, otros = [], []
+        for err in e.details.get("writeErrors", []):
+            (duplicados if err.get("code") == 11000 else otros).append(err)
+        if otros:
+            raise
+        # `tokens` conserva el orden de las operaciones
+        orden = list(tokens)
+        ids = [orden[err["index"]] for err in duplicados]
+        sin_identificador = [
+            UpdateOne({"_id": _id}, {"$set": {"_search": {k: v for k, v in tokens[_id].items() if k != "identifier"}}})
+            for _id in ids
+        ]
+        await collection.bulk_write(sin_identificador, ordered=False)
+        return ids
+
+
+async def rellenar(collection, lote=1000):
+    """Calcula `_search` para los pacientes sin tokens o con una versión anterior."""
+    filtro = {"resourceType": "Patient", "_search.v": {"$ne": SEARCH_VERSION}}
+    operaciones, tokens, duplicados, total = [], {}, [], 0
+    async for doc in collection.find(filtro, projection={"name": 1, "identifier": 1}, batch_size=lote):
+        tokens[doc["_id"]] = calcular_tokens(doc)
+        operaciones.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"_search": tokens[doc["_id"]]}}))
+        if len(operaciones) >= lote:
+            duplicados += await _escribir_lote(collection, operaciones, tokens)
+            total += len(operaciones)
+            operaciones, tokens = [], {}
+            print(f"Documentos actualizados: {total}")
+    if operaciones:
+        duplicados += await _escribir_lote(collection, operaciones, tokens)
+        total += len(operaciones)
+    print(f"Relleno terminado: {total} documentos")
+    if duplicados:
+        # Sin la clave, la creación condicional no los ve: conviene fusionarlos (ver mpi.py)
+        print(f"Identificadores repetidos, guardados sin _search.identifier: {len(duplicados)}")
+        for _id in duplicados:
+            print(f"  {_id}")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lote", type=int, default=1000)
+    args = parser.parse_args()
+
+    from app.controlador.db import COLLECTION_NAME, DB_NAME, crear_cliente
+
+    async def ejecutar():
+        client = crear_cliente()
+        try:
+            await rellenar(client[DB_NAME][COLLECTION_NAME], args.lote)
+        finally:
+            client.close()
+
+    asyncio.run(ejecutar())
+
+
+if __name__ == "__main__":
+    main()
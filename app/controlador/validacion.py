@@ -0,0 +1,149 @@
+import asyncio
+import os
+import re
+import time
+
+from fhir.resources.patient import Patient
+
+from app.controlador.metricas import VALIDATION_LATENCY
+from app.controlador.mpi import agregar_claves
+from app.controlador.perfilado import fase
+from app.controlador.procesos import crear_pool, procesos_por_worker
+from app.controlador.tokens import agregar_tokens
+from app.controlador.versiones import asignar_meta
+
+# Procesos del pool de validación por worker (0 = validar en el propio proceso).
+# Por defecto los núcleos repartidos entre los workers de gunicorn.
+VALIDATION_WORKERS = int(os.getenv("VALIDATION_WORKERS", str(procesos_por_worker())))
+# Pacientes por tarea enviada al pool en validaciones por lote
+VALIDATION_CHUNK_SIZE = int(os.getenv("VALIDATION_CHUNK_SIZE", "100"))
+
+_FECHA = re.compile(r"^\d{4}(-(0[1-9]|1[0-2])(-(0[1-9]|[12]\d|3[01]))?)?$")
+_GENEROS = {"male", "female", "other", "unknown"}
+_ARREGLOS = ("identifier", "name", "telecom", "address", "contact", "communication",
+             "generalPractitioner", "link", "photo")
+
+_pool = None
+
+
+class PatientValidationError(ValueError):
+    """El recurso no es un Patient FHIR válido."""
+
+
+def prevalidar(data):
+    """
+    Chequeo estructural barato, sin construir el modelo pydantic.
+    Rechaza los errores más comunes antes de pagar la validación completa.
+    """
+    if not isinstance(data, dict):
+        raise PatientValidationError("El recurso debe ser un objeto JSON")
+    if data.get("resourceType") != "Patient":
+        raise PatientValidationError(f"resourceType inválido: {data.get('resourceType')!r}")
+    for campo in _ARREGLOS:
+        if campo in data and not isinstance(data[campo], list):
+            raise PatientValidationError(f"'{campo}' debe ser un arreglo")
+    for ident in data.get("identifier", []):
+        if not isinstance(ident, dict):
+            raise PatientValidationError("Cada 'identifier' debe ser un objeto")
+    fecha = data.get("birthDate")
+    if fecha is not None and not (isinstance(fecha, str) and _FECHA.match(fecha)):
+        raise PatientValidationError(f"birthDate inválido: {fecha!r}")
+    genero = data.get("gender")
+    if genero is not None and genero not in _GENEROS:
+        raise PatientValidationError(f"gender inválido: {genero!r}")
+
+
+def validar_completo(data):
+    """
+    Validación completa con fhir.resources; devuelve el documento a guardar.
+    mode="json" guarda los primitivos FHIR (date, dateTime...) como texto:
+    BSON no codifica datetime.date y las búsquedas comparan cadenas.
+    """
+    pat = Patient.model_validate(data)
+    return pat.model_dump(mode="json", by_alias=True, exclude_unset=True)
+
+
+def _validar_lote(lote):
+    # Corre en el proceso hijo. Las excepciones de pydantic no siempre se
+    # pueden serializar con pickle, así que se devuelven como texto. La
+    # duración viaja con el resultado y se registra en el worker.
+    resultados = []
+    for data in lote:
+        inicio = time.perf_counter()
+        try:
+            resultados.append((True, validar_completo(data), time.perf_counter() - inicio))
+        except Exception as e:
+            resultados.append((False, str(e), time.perf_counter() - inicio))
+    return resultados
+
+
+def get_pool():
+    """Crea el pool en el primer uso, dentro del worker (después del fork)."""
+    global _pool
+    if _pool is None and VALIDATION_WORKERS > 0:
+        _pool = crear_pool(VALIDATION_WORKERS)
+    return _pool
+
+
+def cerrar_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def preparar_documento(data):
+    """Campos que se calculan al escribir: meta, tokens de búsqueda y claves MPI."""
+    return agregar_claves(agregar_tokens(asignar_meta(data)))
+
+
+async def validar_lote(datas):
+    """
+    Valida una lista de recursos. Devuelve, en el mismo orden, el documento
+    listo para guardar (ver preparar_documento) o la PatientValidationError
+    de cada uno.
+    """
+    with fase("validate"):
+        return await _validar_lote_async(datas)
+
+
+async def _validar_lote_async(datas):
+    resultados = [None] * len(datas)
+    pendientes = []
+    for i, data in enumerate(datas):
+        try:
+            prevalidar(data)
+            pendientes.append(i)
+        except PatientValidationError as e:
+            resultados[i] = e
+
+    pool = get_pool()
+    lotes = [pendientes[i:i + VALIDATION_CHUNK_SIZE] for i in range(0, len(pendientes), VALIDATION_CHUNK_SIZE)]
+    if pool is None:
+        salidas = [_validar_lote([datas[i] for i in lote]) for lote in lotes]
+    else:
+        loop = asyncio.get_running_loop()
+        salidas = await asyncio.gather(*(
+            loop.run_in_executor(pool, _validar_lote, [datas[i] for i in lote]) for lote in lotes
+        ))
+
+    for lote, salida in zip(lotes, salidas):
+        for i, (ok, valor, segundos) in zip(lote, salida):
+            VALIDATION_LATENCY.observe(segundos)
+            if not ok:
+                resultados[i] = PatientValidationError(valor)
+                continue
+            # Un error al calcular los campos derivados afecta solo a este recurso
+            try:
+                resultados[i] = preparar_documento(valor)
+            except Exception as e:
+                resultados[i] = PatientValidationError(f"No se pudo preparar el documento: {e}")
+    return resultados
+
+
+async def validar_paciente(data):
+    """Valida un solo recurso Patient; lanza PatientValidationError si no es válido."""
+    resultado = (await validar_lote([data]))[0]
+    if isinstance(resultado, Exception):
+        raise resultado
+    return resultado
@@ -0,0 +1,35 @@
+from datetime import datetime, timezone
+
+
+def asignar_meta(data, version_id=1):
+    """
+    Fija meta.versionId y meta.lastUpdated del recurso que se va a guardar.
+    Toda escritura (creación o futura actualización) debe pasar por aquí.
+    """
+    meta = dict(data.get("meta") or {})
+    meta["versionId"] = str(version_id)
+    meta["lastUpdated"] = datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+    data["meta"] = meta
+    return data
+
+
+def etag(doc):
+    """
+    ETag débil del paciente. Incluye el _id además del versionId porque la
+    ruta por identificador puede pasar a resolver a otro paciente.
+    Los documentos anteriores a meta.versionId se tratan como versión 0.
+    """
+    version = (doc.get("meta") or {}).get("versionId", "0")
+    return f'W/"{doc["_id"]}.{version}"'
+
+
+def coincide(if_none_match, valor):
+    """True si la cabecera If-None-Match contiene el ETag (o es *)."""
+    if not if_none_match:
+        return False
+    candidatos = [c.strip() for c in if_none_match.split(",")]
+    # Comparación débil: W/"x" y "x" son equivalentes
+    normalizado = valor[2:] if valor.startswith("W/") else valor
+    return "*" in candidatos or any(
+        (c[2:] if c.startswith("W/") else c) == normalizado for c in candidatos
+    )
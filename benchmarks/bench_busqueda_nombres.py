@@ -0,0 +1,80 @@
+"""
+Benchmark de búsqueda por nombre: regex insensible a mayúsculas sobre
+name.family contra prefijo sobre los tokens normalizados (_search).
+
+Siembra directamente en un mongod local (por defecto 1M de pacientes con
+tokens), crea los índices de la aplicación y mide para varios prefijos la
+latencia, los documentos examinados y cuántos resultados encuentra cada
+enfoque ("gomez" no encuentra "Gómez" con regex).
+
+Uso:
+    python benchmarks/bench_busqueda_nombres.py --mongo-uri mongodb://localhost:27017 --n 1000000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from pymongo import ASCENDING, MongoClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.controlador.tokens import agregar_tokens, filtro_prefijo  # noqa: E402
+from suite import paciente_sintetico  # noqa: E402
+
+PREFIJOS = ["gomez", "Gómez", "mar", "rodri", "munoz"]
+
+
+def sembrar(collection, n, lote=10000):
+    rng = random.Random(7)
+    collection.drop()
+    for inicio in range(0, n, lote):
+        collection.insert_many(
+            [agregar_tokens(paciente_sintetico(i, rng)) for i in range(inicio, min(inicio + lote, n))],
+            ordered=False,
+        )
+    collection.create_index([("name.family", ASCENDING)])
+    collection.create_index([("_search.name", ASCENDING), ("_id", ASCENDING)])
+
+
+def medir(collection, filtro, repeticiones=5):
+    stats = collection.find(filtro).limit(20).explain()["executionStats"]
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        list(collection.find(filtro).sort("_id", ASCENDING).limit(20))
+    return {
+        "ms_por_pagina": round((time.perf_counter() - inicio) / repeticiones * 1000, 2),
+        "docs_examinados": stats["totalDocsExamined"],
+        "total_coincidencias": collection.count_documents(filtro),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-uri", required=True)
+    parser.add_argument("--db", default="bench-crear-solicitud")
+    parser.add_argument("--n", type=int, default=1_000_000)
+    parser.add_argument("--sin-sembrar", action="store_true", help="reutilizar la colección existente")
+    args = parser.parse_args()
+
+    if "mongodb.net" in args.mongo_uri:
+        parser.error("El benchmark no debe ejecutarse contra Atlas de producción")
+
+    collection = MongoClient(args.mongo_uri)[args.db]["bench_nombres"]
+    if not args.sin_sembrar:
+        sembrar(collection, args.n)
+
+    resultados = []
+    for prefijo in PREFIJOS:
+        resultados.append({
+            "prefijo": prefijo,
+            "regex": medir(collection, {"name.family": {"$regex": "^" + prefijo, "$options": "i"}}),
+            "tokens": medir(collection, filtro_prefijo("name", prefijo)),
+        })
+    print(json.dumps(resultados, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
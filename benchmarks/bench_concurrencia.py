@@ -0,0 +1,99 @@
+"""
+Benchmark de concurrencia para las rutas de pacientes.
+
+Lanza N conexiones concurrentes contra un servidor ya levantado
+(p. ej. `gunicorn -c gunicorn.conf.py --workers 1 app.wsgi:app`) y reporta
+solicitudes por segundo. Sirve para comparar la ruta síncrona (pymongo en el
+threadpool) contra la ruta asíncrona (Motor) con un solo UvicornWorker.
+
+Uso:
+    python benchmarks/bench_concurrencia.py --url http://localhost:8000 \
+        --concurrencia 500 --solicitudes 20000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+PACIENTE_EJEMPLO = {
+    "resourceType": "Patient",
+    "identifier": [
+        {"system": "http://cedula", "value": "1020713756"},
+        {"system": "http://pasaporte", "value": "AQ123456789"}
+    ],
+    "name": [
+        {
+            "use": "official",
+            "text": "Mario Enrique Duarte",
+            "family": "Duarte",
+            "given": ["Mario", "Enrique"]
+        }
+    ],
+    "gender": "male",
+    "birthDate": "1986-02-25"
+}
+
+
+async def preparar_paciente(cliente):
+    """
+    Crea el paciente de ejemplo (o reutiliza el de una corrida anterior
+    contra el mismo servidor) y devuelve su _id.
+    """
+    resp = await cliente.post(
+        "/patient", json=PACIENTE_EJEMPLO, headers={"If-None-Exist": "identifier=http://cedula|1020713756"}
+    )
+    resp.raise_for_status()
+    cuerpo = resp.json()
+    return cuerpo.get("inserted_id") or cuerpo["existing_id"]
+
+
+async def ejecutar(url, ruta, concurrencia, total):
+    limites = httpx.Limits(max_connections=concurrencia, max_keepalive_connections=concurrencia)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=60) as cliente:
+        patient_id = await preparar_paciente(cliente)
+        rutas = {
+            "id": (f"/patient/id/{patient_id}", None),
+            "identifier": ("/patient/identifier", {"system": "http://cedula", "value": "1020713756"}),
+        }
+        path, params = rutas[ruta]
+
+        pendientes = iter(range(total))
+        errores = 0
+
+        async def trabajador():
+            nonlocal errores
+            for _ in pendientes:
+                resp = await cliente.get(path, params=params)
+                if resp.status_code != 200:
+                    errores += 1
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+        duracion = time.perf_counter() - inicio
+
+    return {
+        "ruta": ruta,
+        "concurrencia": concurrencia,
+        "solicitudes": total,
+        "errores": errores,
+        "segundos": round(duracion, 3),
+        "rps": round(total / duracion, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--ruta", choices=["id", "identifier"], default="id")
+    parser.add_argument("--concurrencia", type=int, default=500)
+    parser.add_argument("--solicitudes", type=int, default=20000)
+    args = parser.parse_args()
+
+    resultado = asyncio.run(ejecutar(args.url, args.ruta, args.concurrencia, args.solicitudes))
+    print(json.dumps(resultado, indent=2))
+
+
+if __name__ == "__main__":
+    main()
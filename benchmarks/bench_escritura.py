@@ -0,0 +1,80 @@
+"""
+Benchmark del modo de escritura por micro-lotes de POST /patient.
+
+Para cada ventana de lote levanta la aplicación (igual que suite.py) con
+WRITE_MODE y WRITE_BATCH_DELAY_MS, lanza POST /patient a concurrencia fija
+y reporta throughput, latencias y el tamaño medio de lote observado.
+
+El control de admisión de escrituras se desactiva: con su límite por
+worker los lotes nunca pasarían de ese número de documentos, y el exceso
+recibiría 503 en lugar de llegar a insert_many. Si alguna solicitud falla
+la corrida termina con error, porque entonces no mide escrituras.
+
+Uso:
+    python benchmarks/bench_escritura.py --mongo-uri mongodb://localhost:27017 \
+        --modos direct,batch,async --ventanas 1,5,20 --concurrencia 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+
+import httpx
+
+from suite import escenario, esperar_servidor, levantar_servidor, paciente_sintetico
+
+
+async def medir(args, modo, ventana):
+    url = f"http://127.0.0.1:{args.port}"
+    await esperar_servidor(url)
+    rng = random.Random(ventana)
+    contador = iter(range(10 ** 9))
+    limites = httpx.Limits(max_connections=args.concurrencia, max_keepalive_connections=args.concurrencia)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=60) as cliente:
+        resultado = await escenario(
+            cliente, "create", args.concurrencia, args.duracion,
+            lambda i: cliente.post("/patient", json=paciente_sintetico(next(contador), rng)),
+        )
+        resultado["lotes"] = (await cliente.get("/write/stats")).json()
+    resultado.update({"modo": modo, "ventana_ms": ventana})
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    origen = parser.add_mutually_exclusive_group(required=True)
+    origen.add_argument("--mongo-uri")
+    origen.add_argument("--mock", action="store_true")
+    parser.add_argument("--db", default="bench-crear-solicitud")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--modos", default="direct,batch,async")
+    parser.add_argument("--ventanas", default="1,5,20", help="WRITE_BATCH_DELAY_MS a probar")
+    parser.add_argument("--tamano-lote", type=int, default=100)
+    parser.add_argument("--concurrencia", type=int, default=200)
+    parser.add_argument("--duracion", type=float, default=10.0)
+    args = parser.parse_args()
+
+    resultados = []
+    for modo in args.modos.split(","):
+        # En modo direct la ventana no aplica: una sola corrida
+        ventanas = [0] if modo == "direct" else [float(v) for v in args.ventanas.split(",")]
+        for ventana in ventanas:
+            os.environ["WRITE_MODE"] = modo
+            os.environ["WRITE_BATCH_DELAY_MS"] = str(ventana)
+            os.environ["WRITE_BATCH_SIZE"] = str(args.tamano_lote)
+            os.environ["ADMISSION_WRITE_CONCURRENCY"] = "0"
+            servidor = levantar_servidor(args)
+            try:
+                resultados.append(asyncio.run(medir(args, modo, ventana)))
+            finally:
+                servidor.terminate()
+                servidor.wait(timeout=30)
+    print(json.dumps(resultados, indent=2))
+    if any(r["errores"] for r in resultados):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
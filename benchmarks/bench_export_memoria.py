@@ -0,0 +1,95 @@
+"""
+Benchmark de memoria del $export en streaming.
+
+Siembra la colección por tramos usando el endpoint Bundle (POST /) y, tras
+cada tramo, descarga GET /Patient/$export completo mientras muestrea la
+memoria residente (VmRSS) y el pico (VmHWM) del proceso servidor desde
+/proc. Con el streaming el pico debe mantenerse plano aunque crezca el
+número de documentos.
+
+Levantar el servidor con un solo worker y pasar su PID:
+    uvicorn app.app:app --port 8000 &
+    python benchmarks/bench_export_memoria.py --pid $! --tramos 1000,10000,100000
+"""
+import argparse
+import asyncio
+import copy
+import json
+import secrets
+import time
+
+import httpx
+
+from bench_concurrencia import PACIENTE_EJEMPLO
+from suite import ids_creados
+
+
+def memoria_kb(pid, campo):
+    with open(f"/proc/{pid}/status") as f:
+        for linea in f:
+            if linea.startswith(campo + ":"):
+                return int(linea.split()[1])
+    return 0
+
+
+async def sembrar(cliente, desde, hasta, lote=1000, corrida=None):
+    # Identificadores propios de la corrida: repetir el benchmark contra el
+    # mismo servidor no choca con el índice único (PATIENT_IDENTIFIER_UNIQUE)
+    corrida = corrida or secrets.token_hex(4)
+    for inicio in range(desde, hasta, lote):
+        entries = []
+        for n in range(inicio, min(inicio + lote, hasta)):
+            paciente = copy.deepcopy(PACIENTE_EJEMPLO)
+            paciente["identifier"] = [{"system": "http://cedula", "value": f"bench-{corrida}-{n}"}]
+            entries.append({"resource": paciente, "request": {"method": "POST", "url": "Patient"}})
+        resp = await cliente.post("/", json={"resourceType": "Bundle", "type": "batch", "entry": entries})
+        ids_creados(resp)
+
+
+async def exportar(cliente, pid, gzip):
+    headers = {"Accept-Encoding": "gzip" if gzip else "identity"}
+    pico_rss = memoria_kb(pid, "VmRSS")
+    total_bytes = 0
+    inicio = time.perf_counter()
+    async with cliente.stream("GET", "/Patient/$export", headers=headers) as resp:
+        resp.raise_for_status()
+        async for bloque in resp.aiter_raw():
+            total_bytes += len(bloque)
+            pico_rss = max(pico_rss, memoria_kb(pid, "VmRSS"))
+    return {
+        "segundos": round(time.perf_counter() - inicio, 3),
+        "bytes": total_bytes,
+        "rss_pico_kb": pico_rss,
+        "vmhwm_kb": memoria_kb(pid, "VmHWM"),
+    }
+
+
+async def ejecutar(url, pid, tramos, gzip):
+    resultados = []
+    sembrados = 0
+    corrida = secrets.token_hex(4)
+    async with httpx.AsyncClient(base_url=url, timeout=None) as cliente:
+        for objetivo in tramos:
+            await sembrar(cliente, sembrados, objetivo, corrida=corrida)
+            sembrados = objetivo
+            resultado = await exportar(cliente, pid, gzip)
+            resultado["documentos"] = objetivo
+            resultados.append(resultado)
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--pid", type=int, required=True, help="PID del proceso servidor")
+    parser.add_argument("--tramos", default="1000,10000,100000")
+    parser.add_argument("--gzip", action="store_true")
+    args = parser.parse_args()
+
+    tramos = [int(t) for t in args.tramos.split(",")]
+    resultados = asyncio.run(ejecutar(args.url, args.pid, tramos, args.gzip))
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark de serialización de lecturas de pacientes.
+
+Compara, para un paciente pequeño y uno grande (muchos identifier, telecom
+y address):
+  - antes: convert_id + jsonable_encoder de FastAPI + json.dumps
+  - después: orjson directo sobre el documento (FHIRJSONResponse)
+
+Reporta microsegundos por documento y bytes asignados (tracemalloc).
+
+Uso:
+    python benchmarks/bench_serializacion.py --repeticiones 5000
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.controlador.serializacion import dumps  # noqa: E402
+from bench_concurrencia import PACIENTE_EJEMPLO  # noqa: E402
+
+
+def paciente_grande(n=50):
+    p = copy.deepcopy(PACIENTE_EJEMPLO)
+    p["identifier"] = [{"system": f"http://sistema/{i}", "value": str(i)} for i in range(n)]
+    p["telecom"] = [{"system": "phone", "value": f"31422{i:05d}", "use": "home"} for i in range(n)]
+    p["address"] = [
+        {"use": "home", "line": [f"Cra {i} # 1 - 30"], "city": "Bogotá",
+         "state": "Cundinamarca", "postalCode": "11156", "country": "Colombia"}
+        for i in range(n)
+    ]
+    return p
+
+
+def antes(doc):
+    doc["_id"] = str(doc["_id"])
+    return json.dumps(jsonable_encoder(doc)).encode()
+
+
+def despues(doc):
+    return dumps(doc)
+
+
+def medir(funcion, plantilla, repeticiones):
+    # Cada iteración recibe un documento nuevo, como si viniera de find_one
+    docs = [dict(plantilla, _id=ObjectId()) for _ in range(repeticiones)]
+    inicio = time.perf_counter()
+    for doc in docs:
+        funcion(doc)
+    segundos = time.perf_counter() - inicio
+
+    docs = [dict(plantilla, _id=ObjectId()) for _ in range(100)]
+    tracemalloc.start()
+    for doc in docs:
+        funcion(doc)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return round(segundos / repeticiones * 1e6, 2), pico
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=5000)
+    args = parser.parse_args()
+
+    resultados = []
+    for nombre, plantilla in (("pequeno", PACIENTE_EJEMPLO), ("grande", paciente_grande())):
+        for ruta, funcion in (("antes", antes), ("despues", despues)):
+            us, pico = medir(funcion, plantilla, args.repeticiones)
+            resultados.append({"paciente": nombre, "ruta": ruta, "us_por_doc": us, "pico_bytes_100_docs": pico})
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark de sobrecarga: control de admisión activado frente a desactivado.
+
+Levanta la aplicación con MongoDB lento (--mock con latencia simulada, o un
+mongod local ya degradado) y la satura con GET /patient/id a una
+concurrencia muy superior al pool. Sin admisión todas las solicitudes se
+encolan y la latencia crece con la cola; con admisión el exceso recibe 503
+al instante y la latencia de las atendidas queda acotada por la espera
+máxima de la cola.
+
+Uso:
+    python benchmarks/bench_sobrecarga.py --mock --latencia-ms 200 --pool 20 \
+        --concurrencia 1000 --duracion 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+import httpx
+
+from suite import esperar_servidor, levantar_servidor, percentil, sembrar
+
+CONFIGURACIONES = {
+    "sin_admision": {"ADMISSION_READ_CONCURRENCY": "0", "ADMISSION_WRITE_CONCURRENCY": "0"},
+    "con_admision": {},
+}
+
+
+async def saturar(args, nombre):
+    url = f"http://127.0.0.1:{args.port}"
+    await esperar_servidor(url)
+    rng = random.Random(args.semilla)
+    limites = httpx.Limits(max_connections=args.concurrencia, max_keepalive_connections=args.concurrencia)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=args.timeout) as cliente:
+        ids = await sembrar(cliente, args.seed, rng)
+        atendidas, rechazadas, errores, agotadas = [], [], 0, 0
+        fin = time.monotonic() + args.duracion
+
+        async def trabajador(w):
+            nonlocal errores, agotadas
+            i = w
+            while time.monotonic() < fin:
+                inicio = time.perf_counter()
+                try:
+                    resp = await cliente.get(f"/patient/id/{ids[i % len(ids)]}")
+                except httpx.TimeoutException:
+                    agotadas += 1
+                    continue
+                finally:
+                    i += args.concurrencia
+                latencia = time.perf_counter() - inicio
+                if resp.status_code == 503:
+                    rechazadas.append(latencia)
+                elif resp.status_code < 400:
+                    atendidas.append(latencia)
+                else:
+                    errores += 1
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(trabajador(w) for w in range(args.concurrencia)))
+        segundos = time.perf_counter() - inicio
+        admision = (await cliente.get("/admission/stats")).json()
+    return {
+        "configuracion": nombre,
+        "concurrencia": args.concurrencia,
+        "atendidas": len(atendidas),
+        "rechazadas_503": len(rechazadas),
+        "timeouts_cliente": agotadas,
+        "errores": errores,
+        "throughput_ok_rps": round(len(atendidas) / segundos, 1),
+        "ok_p50_ms": round(percentil(atendidas, 50) * 1000, 2),
+        "ok_p99_ms": round(percentil(atendidas, 99) * 1000, 2),
+        "ok_max_ms": round(max(atendidas, default=0) * 1000, 2),
+        "rechazo_p99_ms": round(percentil(rechazadas, 99) * 1000, 2),
+        "admision": admision,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    origen = parser.add_mutually_exclusive_group(required=True)
+    origen.add_argument("--mongo-uri")
+    origen.add_argument("--mock", action="store_true")
+    parser.add_argument("--db", default="bench-crear-solicitud")
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--latencia-ms", type=float, default=200, help="latencia simulada (solo --mock)")
+    parser.add_argument("--pool", type=int, default=20, help="conexiones simuladas (solo --mock)")
+    parser.add_argument("--seed", type=int, default=1000, help="pacientes a sembrar")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--concurrencia", type=int, default=1000)
+    parser.add_argument("--duracion", type=float, default=20.0)
+    parser.add_argument("--timeout", type=float, default=30.0, help="timeout del cliente en segundos")
+    parser.add_argument("--configuraciones", default=",".join(CONFIGURACIONES))
+    args = parser.parse_args()
+
+    os.environ["MOCK_LATENCY_MS"] = str(args.latencia_ms)
+    os.environ["MOCK_POOL_SIZE"] = str(args.pool)
+    resultados = []
+    for nombre in args.configuraciones.split(","):
+        for clave in ("ADMISSION_READ_CONCURRENCY", "ADMISSION_WRITE_CONCURRENCY"):
+            os.environ.pop(clave, None)
+        os.environ.update(CONFIGURACIONES[nombre])
+        servidor = levantar_servidor(args)
+        try:
+            resultados.append(asyncio.run(saturar(args, nombre)))
+        finally:
+            servidor.terminate()
+            servidor.wait(timeout=30)
+    print(json.dumps(resultados, indent=2, ensure_ascii=False))
+    # Un error distinto de 503 invalida la comparación (p. ej. lecturas que fallan rápido)
+    if any(r["errores"] for r in resultados):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
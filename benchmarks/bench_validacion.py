@@ -0,0 +1,72 @@
+"""
+Microbenchmark de validación de Patient.
+
+Compara validaciones por segundo (y por núcleo) de:
+  - antes: Patient.model_validate + model_dump en el propio proceso
+  - después: prevalidación + pool de procesos (app.controlador.validacion)
+  - el rechazo temprano de payloads malformados en la prevalidación
+
+Uso:
+    python benchmarks/bench_validacion.py --n 20000 --procesos 4
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.controlador import validacion  # noqa: E402
+from bench_concurrencia import PACIENTE_EJEMPLO  # noqa: E402
+
+
+def pacientes(n):
+    lista = []
+    for i in range(n):
+        p = copy.deepcopy(PACIENTE_EJEMPLO)
+        p["identifier"][0]["value"] = str(i)
+        lista.append(p)
+    return lista
+
+
+def medir(nombre, n, nucleos, funcion):
+    inicio = time.perf_counter()
+    funcion()
+    segundos = time.perf_counter() - inicio
+    return {
+        "caso": nombre,
+        "n": n,
+        "nucleos": nucleos,
+        "segundos": round(segundos, 3),
+        "validaciones_por_segundo": round(n / segundos, 1),
+        "por_nucleo": round(n / segundos / nucleos, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    datos = pacientes(args.n)
+    malformados = [dict(p, birthDate="25/02/1986") for p in datos]
+    validacion.VALIDATION_WORKERS = args.procesos
+
+    resultados = [
+        medir("antes_en_proceso", args.n, 1,
+              lambda: [validacion.validar_completo(p) for p in datos]),
+        medir("despues_pool", args.n, args.procesos,
+              lambda: asyncio.run(validacion.validar_lote(datos))),
+        medir("rechazo_prevalidacion", args.n, 1,
+              lambda: asyncio.run(validacion.validar_lote(malformados))),
+    ]
+    validacion.cerrar_pool()
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Arnés del índice de identificadores en memoria contra un replica set local.
+
+Los change streams necesitan un replica set; mongomock no los implementa.
+El arnés levanta un mongod de un solo nodo con --replSet en un directorio
+temporal (o usa --mongo-uri si ya hay uno) y comprueba:
+
+1. Carga inicial: todos los identificadores sembrados están en el índice.
+2. Change stream: inserts, cambios de identificador, reemplazos y borrados
+   hechos por otro cliente se reflejan en el índice.
+3. Reinicio: con el snapshot guardado, una instancia nueva reanuda desde el
+   resume token sin recorrer la colección y ve lo escrito mientras estaba
+   detenida.
+4. Latencia de not-found: índice en memoria frente a find_one en MongoDB.
+
+Uso:
+    python benchmarks/harness_indice_identificadores.py --pacientes 5000
+    python benchmarks/harness_indice_identificadores.py --mongo-uri "mongodb://localhost:27017/?replicaSet=rs0"
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.controlador.indice_identificadores import IdentifierIndex  # noqa: E402
+from suite import paciente_sintetico, percentil  # noqa: E402
+
+
+def levantar_replica_set(puerto, directorio):
+    """mongod de un solo nodo con --replSet; devuelve (proceso, uri)."""
+    if shutil.which("mongod") is None:
+        raise SystemExit("No se encontró mongod en el PATH; use --mongo-uri con un replica set")
+    proceso = subprocess.Popen(
+        ["mongod", "--replSet", "rs0", "--port", str(puerto), "--bind_ip", "127.0.0.1",
+         "--dbpath", directorio, "--quiet"],
+        stdout=subprocess.DEVNULL,
+    )
+    return proceso, f"mongodb://127.0.0.1:{puerto}/?replicaSet=rs0&directConnection=true"
+
+
+async def iniciar_replica_set(uri, timeout=30):
+    cliente = AsyncIOMotorClient(uri, serverSelectionTimeoutMS=1000)
+    limite = time.monotonic() + timeout
+    try:
+        while True:
+            try:
+                await cliente.admin.command("replSetInitiate")
+            except Exception as e:
+                if "already initialized" not in str(e) and time.monotonic() < limite:
+                    await asyncio.sleep(0.5)
+                    continue
+            estado = await cliente.admin.command("hello")
+            if estado.get("isWritablePrimary"):
+                return
+            if time.monotonic() > limite:
+                raise RuntimeError("El replica set no eligió primario a tiempo")
+            await asyncio.sleep(0.5)
+    finally:
+        cliente.close()
+
+
+async def esperar(condicion, descripcion, timeout=10):
+    limite = time.monotonic() + timeout
+    while not condicion():
+        if time.monotonic() > limite:
+            raise AssertionError(f"Tiempo agotado esperando: {descripcion}")
+        await asyncio.sleep(0.05)
+
+
+async def ejecutar(args, uri):
+    rng = random.Random(args.semilla)
+    cliente = AsyncIOMotorClient(uri)
+    collection = cliente[args.db]["solicitud"]
+    snapshot = os.path.join(tempfile.mkdtemp(prefix="indice-"), "identificadores.json")
+    resultados = {}
+    try:
+        await collection.drop()
+        await collection.insert_many([paciente_sintetico(i, rng) for i in range(args.pacientes)])
+
+        # 1. Carga inicial
+        indice = IdentifierIndex(snapshot=snapshot, max_await_ms=200)
+        inicio = time.perf_counter()
+        indice.iniciar(collection)
+        await esperar(lambda: indice.listo, "índice listo", timeout=120)
+        resultados["carga_s"] = round(time.perf_counter() - inicio, 3)
+        for i in range(args.pacientes):
+            assert indice.buscar("http://cedula", str(1000000000 + i)) is not None, i
+        print(f"[ok] carga inicial: {len(indice)} claves en {resultados['carga_s']} s")
+
+        # 2. Cambios hechos por otro cliente
+        nuevo = paciente_sintetico(args.pacientes, rng)
+        await collection.insert_one(nuevo)
+        cedula = nuevo["identifier"][0]["value"]
+        await esperar(lambda: indice.buscar("http://cedula", cedula) == nuevo["_id"], "insert")
+
+        await collection.update_one({"_id": nuevo["_id"]}, {"$set": {"identifier.0.value": "X-" + cedula}})
+        await esperar(lambda: indice.buscar("http://cedula", cedula) is None, "cambio de identificador")
+        assert indice.buscar("http://cedula", "X-" + cedula) == nuevo["_id"]
+
+        reemplazo = paciente_sintetico(args.pacientes + 1, rng)
+        reemplazo["_id"] = nuevo["_id"]
+        await collection.replace_one({"_id": nuevo["_id"]}, reemplazo)
+        await esperar(lambda: indice.buscar("http://cedula", reemplazo["identifier"][0]["value"]) == nuevo["_id"], "replace")
+        assert indice.buscar("http://cedula", "X-" + cedula) is None
+
+        await collection.delete_one({"_id": nuevo["_id"]})
+        await esperar(lambda: indice.buscar("http://cedula", reemplazo["identifier"][0]["value"]) is None, "delete")
+        print(f"[ok] change stream: {indice.eventos} eventos aplicados")
+
+        # 3. Reinicio desde el snapshot
+        await indice.detener()
+        assert os.path.exists(snapshot), "no se guardó el snapshot"
+        mientras = paciente_sintetico(args.pacientes + 2, rng)
+        await collection.insert_one(mientras)
+
+        reiniciado = IdentifierIndex(snapshot=snapshot, max_await_ms=200)
+        reiniciado.iniciar(collection)
+        await esperar(lambda: reiniciado.listo, "índice reanudado")
+        assert reiniciado.recargas == 0, "el reinicio recorrió la colección"
+        assert reiniciado.buscar("http://cedula", mientras["identifier"][0]["value"]) == mientras["_id"]
+        print("[ok] reinicio: reanudado desde el resume token sin recorrer la colección")
+
+        # 4. Latencia de not-found
+        memoria, mongo = [], []
+        for i in range(args.consultas):
+            valor = f"inexistente-{i}"
+            t = time.perf_counter()
+            assert reiniciado.buscar("http://cedula", valor) is None
+            memoria.append(time.perf_counter() - t)
+            t = time.perf_counter()
+            assert await collection.find_one(
+                {"identifier": {"$elemMatch": {"system": "http://cedula", "value": valor}}}, {"_id": 1}
+            ) is None
+            mongo.append(time.perf_counter() - t)
+        for nombre, latencias in (("indice", memoria), ("mongo", mongo)):
+            resultados[f"not_found_{nombre}_p50_us"] = round(percentil(latencias, 50) * 1e6, 2)
+            resultados[f"not_found_{nombre}_p99_us"] = round(percentil(latencias, 99) * 1e6, 2)
+        await reiniciado.detener()
+    finally:
+        await collection.drop()
+        cliente.close()
+        shutil.rmtree(os.path.dirname(snapshot), ignore_errors=True)
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-uri", help="replica set existente; si se omite se levanta un mongod local")
+    parser.add_argument("--port", type=int, default=27217)
+    parser.add_argument("--db", default="bench-indice-identificadores")
+    parser.add_argument("--pacientes", type=int, default=5000)
+    parser.add_argument("--consultas", type=int, default=2000)
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args()
+
+    proceso, directorio = None, None
+    uri = args.mongo_uri
+    if uri is None:
+        directorio = tempfile.mkdtemp(prefix="rs-")
+        proceso, uri = levantar_replica_set(args.port, directorio)
+    try:
+        if proceso is not None:
+            asyncio.run(iniciar_replica_set(uri))
+        resultados = asyncio.run(ejecutar(args, uri))
+        for clave, valor in resultados.items():
+            print(f"{clave}: {valor}")
+    finally:
+        if proceso is not None:
+            proceso.terminate()
+            proceso.wait()
+            shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Levanta la aplicación con un MongoDB en memoria (mongomock-motor).
+
+Solo para benchmarks y pruebas locales: un único proceso uvicorn, porque
+la base en memoria no se comparte entre workers.
+
+Con --latencia-ms (o MOCK_LATENCY_MS) cada operación espera ese tiempo y
+ocupa una de --pool conexiones simuladas, para reproducir un Atlas lento.
+
+mongomock no implementa sesiones ni $lookup con pipeline: las sesiones
+causales se reemplazan por una sesión nula (ver adaptar_mongomock) y
+Patient/{id}/$everything no está disponible en memoria.
+
+Uso:
+    python benchmarks/servidor_mock.py --port 8001
+    python benchmarks/servidor_mock.py --port 8001 --latencia-ms 200 --pool 50
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# mongomock no implementa explain(); no hay nada que verificar en memoria
+os.environ.setdefault("INDEX_ENFORCEMENT", "off")
+
+
+class SesionNula:
+    """
+    Sesión de mentira para mongomock, que no implementa sesiones. Es falsa
+    en contexto booleano porque mongomock rechaza cualquier `session`
+    verdadera; sin replicación, la consistencia causal no tiene nada que hacer.
+    """
+    cluster_time = None
+    operation_time = None
+
+    def __bool__(self):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def advance_cluster_time(self, cluster_time):
+        pass
+
+    def advance_operation_time(self, operation_time):
+        pass
+
+    async def end_session(self):
+        pass
+
+
+def adaptar_mongomock():
+    """
+    Completa mongomock-motor donde la aplicación lo necesita:
+
+    - start_session devuelve una SesionNula en lugar de fallar.
+    - with_options (las vistas de lecturas.py) devuelve una colección
+      asíncrona; sin esto devuelve la Collection síncrona de mongomock.
+    - find y find_one reciben una copia de la proyección: mongomock le
+      agrega "_id" a la que recibe y las proyecciones de la app son
+      constantes compartidas.
+    - create_indexes conserva partialFilterExpression, que mongomock
+      descarta (el índice único de identificadores es parcial).
+    """
+    import functools
+
+    from mongomock.collection import Collection
+
+    import mongomock_motor
+    from mongomock_motor import AsyncMongoMockClient, AsyncMongoMockCollection
+
+    async def start_session(self, *a, **k):
+        return SesionNula()
+
+    def with_options(self, *a, **k):
+        sincrona = self._AsyncMongoMockCollection__collection.with_options(*a, **k)
+        return mongomock_motor.AsyncMongoMockCollection(self.database, sincrona)
+
+    def copiar_proyeccion(original):
+        @functools.wraps(original)
+        def envuelto(self, filtro=None, projection=None, *a, **k):
+            if isinstance(projection, dict):
+                projection = dict(projection)
+            return original(self, filtro, projection, *a, **k)
+        return envuelto
+
+    def create_indexes(self, indexes, session=None):
+        return [
+            self.create_index(
+                list(modelo.document["key"].items()),
+                **{k: v for k, v in modelo.document.items() if k != "key"},
+            )
+            for modelo in indexes
+        ]
+
+    Collection.create_indexes = create_indexes
+    AsyncMongoMockClient.start_session = start_session
+    AsyncMongoMockCollection.with_options = with_options
+    for nombre in ("find", "find_one"):
+        setattr(AsyncMongoMockCollection, nombre, copiar_proyeccion(getattr(AsyncMongoMockCollection, nombre)))
+
+
+def ralentizar(clases, latencia, pool):
+    """
+    Simula un MongoDB lento: cada operación ocupa una de `pool` conexiones
+    durante `latencia` segundos, como el pool del driver frente a Atlas.
+    `clases` son las de la colección y de sus vistas de lectura; cada una
+    se envuelve una sola vez y todas comparten el pool.
+    """
+    import asyncio
+    import functools
+
+    conexiones = None
+
+    def envolver(original):
+        @functools.wraps(original)
+        async def lento(self, *a, **k):
+            nonlocal conexiones
+            if conexiones is None:
+                conexiones = asyncio.Semaphore(pool)
+            async with conexiones:
+                await asyncio.sleep(latencia)
+                return await original(self, *a, **k)
+        return lento
+
+    for clase in set(clases):
+        for nombre in ("find_one", "insert_one", "insert_many"):
+            setattr(clase, nombre, envolver(getattr(clase, nombre)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latencia-ms", type=float, default=float(os.getenv("MOCK_LATENCY_MS", "0")),
+                        help="latencia simulada por operación de MongoDB")
+    parser.add_argument("--pool", type=int, default=int(os.getenv("MOCK_POOL_SIZE", "50")),
+                        help="conexiones simuladas cuando hay latencia")
+    args = parser.parse_args()
+
+    from mongomock_motor import AsyncMongoMockClient
+
+    import app.controlador.db as db
+    from app.controlador.lecturas import coleccion_causal, coleccion_lecturas
+
+    adaptar_mongomock()
+    ralentizado = False
+
+    def crear_cliente(**opciones):
+        nonlocal ralentizado
+        client = AsyncMongoMockClient()
+        if args.latencia_ms > 0 and not ralentizado:
+            # Las lecturas van por las vistas de lecturas.py, no por la colección
+            coleccion = client[db.DB_NAME][db.COLLECTION_NAME]
+            clases = [type(coleccion), type(coleccion_lecturas(coleccion)), type(coleccion_causal(coleccion))]
+            ralentizar(clases, args.latencia_ms / 1000, args.pool)
+            ralentizado = True
+        return client
+
+    # Se reemplaza antes de importar app.app, que toma crear_cliente por nombre
+    db.crear_cliente = crear_cliente
+
+    import uvicorn
+    from app.app import app
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
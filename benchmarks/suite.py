@@ -0,0 +1,260 @@
+"""
+Suite de carga reproducible para las rutas de pacientes.
+
+1. Levanta la aplicación:
+   - con --mongo-uri: gunicorn con gunicorn.conf.py contra un mongod local
+     (nunca apuntar al URI de producción);
+   - con --mock: un proceso uvicorn con MongoDB en memoria (servidor_mock.py).
+2. Siembra N pacientes sintéticos con la forma del ejemplo de
+   oldFiles/validatePatient.py, usando el endpoint Bundle.
+3. Ejecuta create, get-by-id y get-by-identifier a concurrencia fija.
+4. Escribe throughput, latencias p50/p95/p99 y tasa de errores en JSON y,
+   si se pasa --baseline, marca las regresiones frente a una corrida
+   guardada. Una tasa de errores mayor que la de la línea base también es
+   una regresión: un servidor que responde 400 rápido no es más rápido.
+
+Uso:
+    python benchmarks/suite.py --mock --seed 5000 --concurrencia 10,100 \
+        --duracion 10 --salida resultado.json
+    python benchmarks/suite.py --mongo-uri mongodb://localhost:27017 \
+        --baseline benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+NOMBRES = ["Mario", "Enrique", "Ana", "María", "José", "Luis", "Camila", "Andrés", "Sofía", "Julián"]
+APELLIDOS = ["Duarte", "Gómez", "Rodríguez", "Martínez", "Pérez", "López", "Díaz", "Muñoz", "Rojas", "Vargas"]
+CIUDADES = ["Bogotá", "Medellín", "Cali", "Barranquilla", "Bucaramanga"]
+
+
+def paciente_sintetico(n, rng):
+    """Paciente con la misma forma que el ejemplo de oldFiles/validatePatient.py."""
+    given = rng.sample(NOMBRES, 2)
+    family = rng.choice(APELLIDOS)
+    return {
+        "resourceType": "Patient",
+        "identifier": [
+            {"system": "http://cedula", "value": f"{1000000000 + n}"},
+            {"system": "http://pasaporte", "value": f"AQ{n:09d}"},
+        ],
+        "name": [{"use": "official", "text": f"{' '.join(given)} {family}", "family": family, "given": given}],
+        "telecom": [
+            {"system": "phone", "value": f"31{rng.randint(0, 99999999):08d}", "use": "home"},
+            {"system": "email", "value": f"paciente{n}@example.com", "use": "home"},
+        ],
+        "gender": rng.choice(["male", "female"]),
+        "birthDate": f"{rng.randint(1940, 2020)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "address": [{
+            "use": "home",
+            "line": [f"Cra {rng.randint(1, 200)} # {rng.randint(1, 200)} - {rng.randint(1, 99)}"],
+            "city": rng.choice(CIUDADES),
+            "state": "Cundinamarca",
+            "postalCode": "11156",
+            "country": "Colombia",
+        }],
+    }
+
+
+# --- Servidor ---
+
+def levantar_servidor(args):
+    env = dict(os.environ)
+    if args.mock:
+        comando = [sys.executable, os.path.join(RAIZ, "benchmarks", "servidor_mock.py"), "--port", str(args.port)]
+    else:
+        env["MONGO_URI"] = args.mongo_uri
+        env["MONGO_DB_NAME"] = args.db
+        comando = ["gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{args.port}", "app.wsgi:app"]
+    return subprocess.Popen(comando, cwd=RAIZ, env=env)
+
+
+async def esperar_servidor(url, timeout=60):
+    limite = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=url) as cliente:
+        while time.monotonic() < limite:
+            try:
+                if (await cliente.get("/health/db")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.5)
+    raise RuntimeError("El servidor no respondió a tiempo")
+
+
+# --- Carga ---
+
+async def sembrar(cliente, n, rng, lote=1000):
+    """Siembra n pacientes con Bundles batch; falla si alguna entrada se rechaza."""
+    ids = []
+    for inicio in range(0, n, lote):
+        entries = [
+            {"resource": paciente_sintetico(i, rng), "request": {"method": "POST", "url": "Patient"}}
+            for i in range(inicio, min(inicio + lote, n))
+        ]
+        resp = await cliente.post("/", json={"resourceType": "Bundle", "type": "batch", "entry": entries})
+        ids += ids_creados(resp)
+    return ids
+
+
+def ids_creados(resp):
+    """_id de cada entrada de un batch-response; falla si alguna fue rechazada."""
+    resp.raise_for_status()
+    ids = []
+    for entry in resp.json()["entry"]:
+        respuesta = entry["response"]
+        if "location" not in respuesta:
+            raise RuntimeError(f"La siembra fue rechazada: {respuesta}")
+        ids.append(respuesta["location"].split("/")[1])
+    return ids
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    k = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[k]
+
+
+async def escenario(cliente, nombre, concurrencia, duracion, solicitud):
+    latencias, errores = [], 0
+    fin = time.monotonic() + duracion
+
+    async def trabajador(w):
+        nonlocal errores
+        i = w
+        while time.monotonic() < fin:
+            inicio = time.perf_counter()
+            resp = await solicitud(i)
+            latencias.append(time.perf_counter() - inicio)
+            if resp.status_code >= 400:
+                errores += 1
+            i += concurrencia
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabajador(w) for w in range(concurrencia)))
+    segundos = time.perf_counter() - inicio
+    return {
+        "escenario": nombre,
+        "concurrencia": concurrencia,
+        "solicitudes": len(latencias),
+        "errores": errores,
+        "tasa_errores": round(errores / len(latencias), 4) if latencias else 0.0,
+        "throughput_rps": round(len(latencias) / segundos, 1),
+        "p50_ms": round(percentil(latencias, 50) * 1000, 2),
+        "p95_ms": round(percentil(latencias, 95) * 1000, 2),
+        "p99_ms": round(percentil(latencias, 99) * 1000, 2),
+    }
+
+
+async def ejecutar(args):
+    rng = random.Random(args.semilla)
+    url = f"http://127.0.0.1:{args.port}"
+    await esperar_servidor(url)
+
+    max_c = max(args.concurrencia)
+    limites = httpx.Limits(max_connections=max_c, max_keepalive_connections=max_c)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=60) as cliente:
+        ids = await sembrar(cliente, args.seed, rng)
+        nuevo = iter(range(args.seed, 10 ** 9))
+
+        escenarios = {
+            "create": lambda i: cliente.post("/patient", json=paciente_sintetico(next(nuevo), rng)),
+            "get_by_id": lambda i: cliente.get(f"/patient/id/{ids[i % len(ids)]}"),
+            "get_by_identifier": lambda i: cliente.get(
+                "/patient/identifier",
+                params={"system": "http://cedula", "value": str(1000000000 + i % args.seed)},
+            ),
+        }
+        resultados = []
+        for nombre, solicitud in escenarios.items():
+            for c in args.concurrencia:
+                resultados.append(await escenario(cliente, nombre, c, args.duracion, solicitud))
+    return resultados
+
+
+# --- Comparación con la línea base ---
+
+def comparar(resultados, baseline, tolerancia, tolerancia_errores=0.001):
+    """
+    Devuelve la lista de regresiones frente a la línea base. La tasa de
+    errores se compara en valor absoluto: más de `tolerancia_errores` por
+    encima de la de la línea base es una regresión.
+    """
+    previos = {(r["escenario"], r["concurrencia"]): r for r in baseline["resultados"]}
+    regresiones = []
+    for r in resultados:
+        base = previos.get((r["escenario"], r["concurrencia"]))
+        if base is None:
+            continue
+        if r["throughput_rps"] < base["throughput_rps"] * (1 - tolerancia):
+            regresiones.append({**r, "metrica": "throughput_rps", "baseline": base["throughput_rps"]})
+        for p in ("p95_ms", "p99_ms"):
+            if r[p] > base[p] * (1 + tolerancia):
+                regresiones.append({**r, "metrica": p, "baseline": base[p]})
+        tasa_base = base.get("tasa_errores", 0.0)
+        if r["tasa_errores"] > tasa_base + tolerancia_errores:
+            regresiones.append({**r, "metrica": "tasa_errores", "baseline": tasa_base})
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    origen = parser.add_mutually_exclusive_group(required=True)
+    origen.add_argument("--mongo-uri", help="mongod local (p. ej. mongodb://localhost:27017)")
+    origen.add_argument("--mock", action="store_true", help="MongoDB en memoria")
+    parser.add_argument("--db", default="bench-crear-solicitud")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=5000, help="pacientes a sembrar")
+    parser.add_argument("--semilla", type=int, default=42, help="semilla del generador aleatorio")
+    parser.add_argument("--concurrencia", default="10,50,200")
+    parser.add_argument("--duracion", type=float, default=10.0, help="segundos por escenario")
+    parser.add_argument("--salida", help="archivo JSON de resultados")
+    parser.add_argument("--baseline", help="JSON de una corrida anterior para comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.10)
+    parser.add_argument("--tolerancia-errores", type=float, default=0.001,
+                        help="aumento máximo de la tasa de errores frente a la línea base")
+    args = parser.parse_args()
+    args.concurrencia = [int(c) for c in args.concurrencia.split(",")]
+
+    if args.mongo_uri and "mongodb.net" in args.mongo_uri:
+        parser.error("La suite no debe ejecutarse contra Atlas de producción")
+
+    servidor = levantar_servidor(args)
+    try:
+        resultados = asyncio.run(ejecutar(args))
+    finally:
+        servidor.terminate()
+        servidor.wait(timeout=30)
+
+    reporte = {
+        "modo": "mock" if args.mock else "mongod",
+        "seed": args.seed,
+        "duracion": args.duracion,
+        "resultados": resultados,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            reporte["regresiones"] = comparar(resultados, json.load(f), args.tolerancia, args.tolerancia_errores)
+
+    salida = json.dumps(reporte, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w") as f:
+            f.write(salida)
+    print(salida)
+    if reporte.get("regresiones"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,12 @@
+import gc
+import os
+import shutil
+import time
+
 # Número de workers (procesos) que Gunicorn usará
-workers = 4
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+# Los pools de procesos de cada worker se reparten los núcleos (procesos.py)
+os.environ.setdefault("GUNICORN_WORKERS", str(workers))
 
 # Tipo de worker (usamos uvicorn para FastAPI)
 worker_class = "uvicorn.workers.UvicornWorker"
@@ -11,4 +18,50 @@ bind = "0.0.0.0:8000"
 timeout = 120
 
 # Nivel de log (debug, info, warning, error, critical)
-loglevel = "info"
\ No newline at end of file
+loglevel = "info"
+
+# Carga la aplicación (y los modelos de fhir.resources) una sola vez en el
+# master; los workers la heredan por copy-on-write. Es seguro porque el
+# cliente de MongoDB y el pool de validación se crean dentro de cada worker.
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+if preload_app:
+    os.environ["GUNICORN_PRELOADED"] = "1"
+
+# --- Métricas Prometheus en modo multiproceso ---
+# Cada worker escribe sus métricas en este directorio y /metrics las agrega,
+# sin importar qué worker atienda la solicitud.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/crear-solicitud-metrics")
+
+
+def preparar_directorio_metricas():
+    # Limpia los archivos de una ejecución anterior
+    directorio = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(directorio, ignore_errors=True)
+    os.makedirs(directorio, exist_ok=True)
+
+
+# Con preload_app gunicorn importa la aplicación (y crea las métricas) en
+# Arbiter.setup, antes de on_starting: el directorio debe existir ya aquí.
+if preload_app:
+    preparar_directorio_metricas()
+
+
+def on_starting(server):
+    if not preload_app:
+        preparar_directorio_metricas()
+
+
+def pre_fork(server, worker):
+    # Mueve los objetos ya creados a la generación permanente del GC para que
+    # las recolecciones del worker no toquen (ni copien) esas páginas.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Referencia para medir el tiempo de arranque en frío del worker
+    os.environ["WORKER_FORKED_AT"] = str(time.time())
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)